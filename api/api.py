@@ -1,17 +1,15 @@
 from flask import Flask, jsonify, request, make_response
 
 import argparse
+import os
 import uuid
 import json
 import time
-from tqdm import tqdm
 
 import tensorflow as tf
 
 from deepface import DeepFace
-from deepface.basemodels import VGGFace, OpenFace, Facenet, FbDeepFace, DeepID
-from deepface.basemodels.DlibResNet import DlibResNet
-from deepface.extendedmodels import Age, Gender, Race, Emotion
+from deepface.commons import functions, registry, face_cache
 
 #import DeepFace
 #from basemodels import VGGFace, OpenFace, Facenet, FbDeepFace
@@ -22,73 +20,66 @@ from deepface.extendedmodels import Age, Gender, Race, Emotion
 app = Flask(__name__)
 
 #------------------------------
+#models are built on first use and kept in the registry. a deployment can build some of them at startup.
+#the service runs on tf 1.x graphs. evicted models are not released there, so resident models are not bounded by a memory budget.
+#DEEPFACE_PRELOAD_MODELS=VGG-Face,Emotion python api.py
+#DEEPFACE_CPU_WORKERS shares cpu cores among the workers serving on the same box, e.g. the number of gunicorn workers.
+#DEEPFACE_MAX_DETECTION_SIDE runs face detectors on downscaled copies of large uploads, e.g. 1024.
+#DEEPFACE_FACE_CACHE_PATH stores aligned faces of uploads in a directory shared by workers. repeated photos are not detected again.
 
-tic = time.time()
+recognition_models = ['VGG-Face', 'OpenFace', 'Facenet', 'DeepFace', 'DeepID', 'Dlib', 'Ensemble']
+ensemble_models = ['VGG-Face', 'Facenet', 'OpenFace', 'DeepFace']
 
-print("Loading Face Recognition Models...")
-
-pbar = tqdm(range(0,6), desc='Loading Face Recognition Models...')
-
-for index in pbar:
-	if index == 0:
-		pbar.set_description("Loading VGG-Face")
-		vggface_model = VGGFace.loadModel()
-	elif index == 1:
-		pbar.set_description("Loading OpenFace")
-		openface_model = OpenFace.loadModel()
-	elif index == 2:
-		pbar.set_description("Loading Google FaceNet")
-		facenet_model = Facenet.loadModel()
-	elif index == 3:
-		pbar.set_description("Loading Facebook DeepFace")
-		deepface_model = FbDeepFace.loadModel()
-	elif index == 4:
-		pbar.set_description("Loading DeepID DeepFace")
-		deepid_model = DeepID.loadModel()
-	elif index == 5:
-		pbar.set_description("Loading Dlib ResNet DeepFace")
-		dlib_model = DlibResNet()
-
-toc = time.time()
-
-print("Face recognition models are built in ", toc-tic," seconds")
-
-#------------------------------
-
-tic = time.time()
-
-print("Loading Facial Attribute Analysis Models...")
-
-pbar = tqdm(range(0,4), desc='Loading Facial Attribute Analysis Models...')
-
-for index in pbar:
-	if index == 0:
-		pbar.set_description("Loading emotion analysis model")
-		emotion_model = Emotion.loadModel()
-	elif index == 1:
-		pbar.set_description("Loading age prediction model")
-		age_model = Age.loadModel()
-	elif index == 2:
-		pbar.set_description("Loading gender prediction model")
-		gender_model = Gender.loadModel()
-	elif index == 3:
-		pbar.set_description("Loading race prediction model")
-		race_model = Race.loadModel()
-
-toc = time.time()
-
-facial_attribute_models = {}
-facial_attribute_models["emotion"] = emotion_model
-facial_attribute_models["age"] = age_model
-facial_attribute_models["gender"] = gender_model
-facial_attribute_models["race"] = race_model
+def preload(model_names):
+	
+	tic = time.time()
+	
+	build_models = []
+	for model_name in model_names:
+		if model_name == 'Ensemble':
+			build_models += ensemble_models
+		else:
+			build_models.append(model_name)
+	
+	#weights are read in concurrent threads while models are built one by one
+	registry.get_many(build_models)
+	
+	toc = time.time()
+	
+	print(model_names," are built in ", toc-tic," seconds")
 
-print("Facial attribute analysis models are built in ", toc-tic," seconds")
+def configure(preload_models = '', warmup_batch_sizes = '1', cpu_workers = None, max_detection_side = None, face_cache_path = None):
+	
+	#threads must be planned before models are built
+	if cpu_workers is not None and cpu_workers != '':
+		functions.plan_cpu_resources(workers = int(cpu_workers))
+	
+	if max_detection_side is not None and max_detection_side != '':
+		functions.set_max_detection_side(int(max_detection_side))
+	
+	if face_cache_path is not None and face_cache_path != '':
+		face_cache.configure(budget = face_cache.memory_budget, path = face_cache_path)
+	
+	model_names = [model_name.strip() for model_name in preload_models.split(",") if model_name.strip() != '']
+	batch_sizes = [int(batch_size) for batch_size in warmup_batch_sizes.split(",") if batch_size.strip() != '']
+	
+	if len(model_names) > 0:
+		with graph.as_default():
+			preload(model_names)
+			
+			#first predictions are slow. run them before the first request.
+			if len(batch_sizes) > 0:
+				registry.warmup(batch_sizes = batch_sizes)
 
 #------------------------------
 
 graph = tf.get_default_graph()
 
+#python api.py configures the service from its arguments below. their defaults are read from the same environment variables.
+#configuring twice would build preloaded models in a session replaced by the cpu plan afterwards.
+if __name__ != '__main__':
+	configure(os.environ.get("DEEPFACE_PRELOAD_MODELS", ""), os.environ.get("DEEPFACE_WARMUP_BATCH_SIZES", "1"), os.environ.get("DEEPFACE_CPU_WORKERS"), os.environ.get("DEEPFACE_MAX_DETECTION_SIDE"), os.environ.get("DEEPFACE_FACE_CACHE_PATH"))
+
 #------------------------------
 #Service API Interface
 
@@ -129,8 +120,7 @@ def analyze():
 		
 		#---------------------------
 
-		#resp_obj = DeepFace.analyze(instances, actions=actions)
-		resp_obj = DeepFace.analyze(instances, actions=actions, models=facial_attribute_models)
+		resp_obj = DeepFace.analyze(instances, actions=actions)
 		
 		#---------------------------
 
@@ -194,29 +184,10 @@ def verify():
 		
 		#--------------------------
 		
-		if model_name == "VGG-Face":
-			resp_obj = DeepFace.verify(instances, model_name = model_name, distance_metric = distance_metric, model = vggface_model)
-		elif model_name == "Facenet":
-			resp_obj = DeepFace.verify(instances, model_name = model_name, distance_metric = distance_metric, model = facenet_model)
-		elif model_name == "OpenFace":
-			resp_obj = DeepFace.verify(instances, model_name = model_name, distance_metric = distance_metric, model = openface_model)
-		elif model_name == "DeepFace":
-			resp_obj = DeepFace.verify(instances, model_name = model_name, distance_metric = distance_metric, model = deepface_model)
-		elif model_name == "DeepID":
-			resp_obj = DeepFace.verify(instances, model_name = model_name, distance_metric = distance_metric, model = deepid_model)
-		elif model_name == "Dlib":
-			resp_obj = DeepFace.verify(instances, model_name = model_name, distance_metric = distance_metric, model = dlib_model)
-		elif model_name == "Ensemble":
-			models =  {}
-			models["VGG-Face"] = vggface_model
-			models["Facenet"] = facenet_model
-			models["OpenFace"] = openface_model
-			models["DeepFace"] = deepface_model
-			
-			resp_obj = DeepFace.verify(instances, model_name = model_name, model = models)
-			
+		if model_name in recognition_models:
+			resp_obj = DeepFace.verify(instances, model_name = model_name, distance_metric = distance_metric)
 		else:
-			return jsonify({'success': False, 'error': 'You must pass a valid model name. Available models are VGG-Face, Facenet, OpenFace, DeepFace but you passed %s' % (model_name)}), 205
+			return jsonify({'success': False, 'error': 'You must pass a valid model name. Available models are %s but you passed %s' % (recognition_models, model_name)}), 205
 		
 	#--------------------------
 	
@@ -228,6 +199,18 @@ def verify():
 	return resp_obj, 200
 
 
+@app.route('/models', methods=['GET'])
+def models():
+	
+	resp_obj = {}
+	resp_obj["resident"] = registry.resident()
+	resp_obj["memory_usage_in_mb"] = sum(resp_obj["resident"].values())
+	resp_obj["load_times_in_seconds"] = dict((model_name, registry.load_times[model_name]) for model_name in resp_obj["resident"].keys() if model_name in registry.load_times)
+	resp_obj["warmup_in_seconds"] = dict((model_name, registry.warmup_reports[model_name]) for model_name in resp_obj["resident"].keys() if model_name in registry.warmup_reports)
+	resp_obj["face_cache"] = face_cache.stats()
+	
+	return jsonify(resp_obj), 200
+
 if __name__ == '__main__':
 	parser = argparse.ArgumentParser()
 	parser.add_argument(
@@ -235,5 +218,31 @@ if __name__ == '__main__':
 		type=int,
 		default=5000,
 		help='Port of serving api')
+	parser.add_argument(
+		'--preload',
+		type=str,
+		default=os.environ.get("DEEPFACE_PRELOAD_MODELS", ""),
+		help='Comma separated model names to build at startup, e.g. VGG-Face,Emotion')
+	parser.add_argument(
+		'--warmup-batch-sizes',
+		type=str,
+		default=os.environ.get("DEEPFACE_WARMUP_BATCH_SIZES", "1"),
+		help='Comma separated batch sizes fed to preloaded models before serving, e.g. 1,8. Pass an empty string to skip.')
+	parser.add_argument(
+		'--cpu-workers',
+		type=int,
+		default=os.environ.get("DEEPFACE_CPU_WORKERS"),
+		help='Number of deepface workers sharing the cores of this box. TF, OpenCV and deepface thread pools are sized accordingly.')
+	parser.add_argument(
+		'--max-detection-side',
+		type=int,
+		default=os.environ.get("DEEPFACE_MAX_DETECTION_SIDE"),
+		help='Longest side of the images face detectors run on. Larger images are downscaled for detection only, e.g. 1024.')
+	parser.add_argument(
+		'--face-cache-path',
+		type=str,
+		default=os.environ.get("DEEPFACE_FACE_CACHE_PATH"),
+		help='Directory to store aligned faces of uploaded images. Faces of repeated images are not detected again.')
 	args = parser.parse_args()
+	configure(args.preload, args.warmup_batch_sizes, args.cpu_workers, args.max_detection_side, args.face_cache_path)
 	app.run(host='0.0.0.0', port=args.port)
@@ -18,9 +18,9 @@ import pickle
 
 from .basemodels import VGGFace, OpenFace, Facenet, FbDeepFace, DeepID
 from .extendedmodels import Age, Gender, Race, Emotion
-from .commons import functions, realtime, distance as dst
+from .commons import functions, realtime, registry, quantization, opencv_dnn, distance as dst
 
-def verify(img1_path, img2_path = '', model_name ='VGG-Face', distance_metric = 'cosine', model = None, enforce_detection = True, detector_backend = 'opencv'):
+def verify(img1_path, img2_path = '', model_name ='VGG-Face', distance_metric = 'cosine', model = None, enforce_detection = True, detector_backend = 'opencv', precision = 'float32', engine = 'keras'):
 
 	tic = time.time()
 
@@ -40,25 +40,14 @@ def verify(img1_path, img2_path = '', model_name ='VGG-Face', distance_metric =
 		
 		import lightgbm as lgb #lightgbm==2.3.1
 		
+		if precision != 'float32':
+			raise ValueError("Reduced precision is available for single models but ensemble learning is enabled")
+		
 		if model == None:
-			model = {}
-			
-			model_pbar = tqdm(range(0, 4), desc='Face recognition models')
-			
-			for index in model_pbar:
-				
-				if index == 0:
-					model_pbar.set_description("Loading VGG-Face")
-					model["VGG-Face"] = VGGFace.loadModel()
-				elif index == 1:
-					model_pbar.set_description("Loading Google FaceNet")
-					model["Facenet"] = Facenet.loadModel()
-				elif index == 2:
-					model_pbar.set_description("Loading OpenFace")
-					model["OpenFace"] = OpenFace.loadModel()
-				elif index == 3:
-					model_pbar.set_description("Loading Facebook DeepFace")
-					model["DeepFace"] = FbDeepFace.loadModel()
+			if engine == 'keras':
+				model = registry.get_many(["VGG-Face", "Facenet", "OpenFace", "DeepFace"])
+			else:
+				model = dict((ensemble_model_name, build_model(ensemble_model_name, engine = engine)) for ensemble_model_name in ["VGG-Face", "Facenet", "OpenFace", "DeepFace"])
 					
 		#--------------------------
 		#validate model dictionary because it might be passed from input as pre-trained
@@ -94,19 +83,13 @@ def verify(img1_path, img2_path = '', model_name ='VGG-Face', distance_metric =
 					
 					#input_shape = custom_model.layers[0].input_shape[1:3] #my environment returns (None, 224, 224, 3) but some people mentioned that they got [(None, 224, 224, 3)]. I think this is because of version issue.
 	
-					input_shape = custom_model.layers[0].input_shape
-					
-					if type(input_shape) == list:
-						input_shape = input_shape[0][1:3]
-					else:
-						input_shape = input_shape[1:3]
-					
+					input_shape = functions.find_input_shape(custom_model)
 					
 					img1 = functions.preprocess_face(img = img1_path, target_size = input_shape, enforce_detection = enforce_detection, detector_backend = detector_backend)
 					img2 = functions.preprocess_face(img = img2_path, target_size = input_shape, enforce_detection = enforce_detection, detector_backend = detector_backend)
 					
-					img1_representation = custom_model.predict(img1)[0,:]
-					img2_representation = custom_model.predict(img2)[0,:]
+					img1_representation = functions.predict(custom_model, img1)[0,:]
+					img2_representation = functions.predict(custom_model, img2)[0,:]
 					
 					for j in metrics:
 						if j == 'cosine':
@@ -200,28 +183,27 @@ def verify(img1_path, img2_path = '', model_name ='VGG-Face', distance_metric =
 	if model == None:
 		if model_name == 'VGG-Face':
 			print("Using VGG-Face model backend and", distance_metric,"distance.")
-			model = VGGFace.loadModel()
+			model = build_model("VGG-Face", precision, engine)
 
 		elif model_name == 'OpenFace':
 			print("Using OpenFace model backend", distance_metric,"distance.")
-			model = OpenFace.loadModel()
+			model = build_model("OpenFace", precision, engine)
 
 		elif model_name == 'Facenet':
 			print("Using Facenet model backend", distance_metric,"distance.")
-			model = Facenet.loadModel()
+			model = build_model("Facenet", precision, engine)
 
 		elif model_name == 'DeepFace':
 			print("Using FB DeepFace model backend", distance_metric,"distance.")
-			model = FbDeepFace.loadModel()
+			model = build_model("DeepFace", precision, engine)
 		
 		elif model_name == 'DeepID':
 			print("Using DeepID2 model backend", distance_metric,"distance.")
-			model = DeepID.loadModel()
+			model = build_model("DeepID", precision, engine)
 		
 		elif model_name == 'Dlib':
 			print("Using Dlib ResNet model backend", distance_metric,"distance.")
-			from deepface.basemodels.DlibResNet import DlibResNet #this is not a must because it is very huge.
-			model = DlibResNet()
+			model = build_model("Dlib", precision, engine)
 
 		else:
 			raise ValueError("Invalid model_name passed - ", model_name)
@@ -236,12 +218,7 @@ def verify(img1_path, img2_path = '', model_name ='VGG-Face', distance_metric =
 		input_shape = (150, 150, 3)
 	
 	else: #keras based models
-		input_shape = model.layers[0].input_shape
-		
-		if type(input_shape) == list:
-			input_shape = input_shape[0][1:3]
-		else:
-			input_shape = input_shape[1:3]
+		input_shape = functions.find_input_shape(model)
 	  
 	input_shape_x = input_shape[0]
 	input_shape_y = input_shape[1]
@@ -270,14 +247,16 @@ def verify(img1_path, img2_path = '', model_name ='VGG-Face', distance_metric =
 			#----------------------
 			#crop and align faces
 
-			img1 = functions.preprocess_face(img=img1_path, target_size=(input_shape_y, input_shape_x), enforce_detection = enforce_detection, detector_backend = detector_backend)
-			img2 = functions.preprocess_face(img=img2_path, target_size=(input_shape_y, input_shape_x), enforce_detection = enforce_detection, detector_backend = detector_backend)
+			imgs = functions.preprocess_face_batch([img1_path, img2_path], target_size=(input_shape_y, input_shape_x), enforce_detection = enforce_detection, detector_backend = detector_backend, rgb_uint8 = model_name == 'Dlib')
 
 			#----------------------
 			#find embeddings
 
-			img1_representation = model.predict(img1)[0,:]
-			img2_representation = model.predict(img2)[0,:]
+			#both faces are represented in a single call
+			representations = functions.predict(model, imgs)
+			
+			img1_representation = representations[0,:]
+			img2_representation = representations[1,:]
 
 			#----------------------
 			#find distances between embeddings
@@ -344,7 +323,9 @@ def verify(img1_path, img2_path = '', model_name ='VGG-Face', distance_metric =
 		#return resp_objects
 
 
-def analyze(img_path, actions = [], models = {}, enforce_detection = True, detector_backend = 'opencv'):
+def analyze(img_path, actions = [], models = {}, enforce_detection = True, detector_backend = 'opencv', engine = 'keras', all_faces = False):
+	
+	#all_faces analyzes every face in an image instead of the first one. a list of faces with their regions is returned for each image.
 
 	if type(img_path) == list:
 		img_paths = img_path.copy()
@@ -358,6 +339,9 @@ def analyze(img_path, actions = [], models = {}, enforce_detection = True, detec
 	#if a specific target is not passed, then find them all
 	if len(actions) == 0:
 		actions= ['emotion', 'age', 'gender', 'race']
+	
+	emotion_labels = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
+	race_labels = ['asian', 'indian', 'black', 'white', 'middle eastern', 'latino hispanic']
 
 	#print("Actions to do: ", actions)
 
@@ -368,28 +352,35 @@ def analyze(img_path, actions = [], models = {}, enforce_detection = True, detec
 			print("already built emotion model is passed")
 			emotion_model = models['emotion']
 		else:
-			emotion_model = Emotion.loadModel()
+			emotion_model = build_model("Emotion", engine = engine)
 
 	if 'age' in actions:
 		if 'age' in models:
 			#print("already built age model is passed")
 			age_model = models['age']
 		else:
-			age_model = Age.loadModel()
+			age_model = build_model("Age", engine = engine)
 
 	if 'gender' in actions:
 		if 'gender' in models:
 			print("already built gender model is passed")
 			gender_model = models['gender']
 		else:
-			gender_model = Gender.loadModel()
+			gender_model = build_model("Gender", engine = engine)
 
 	if 'race' in actions:
 		if 'race' in models:
 			print("already built race model is passed")
 			race_model = models['race']
 		else:
-			race_model = Race.loadModel()
+			race_model = build_model("Race", engine = engine)
+	
+	#age, gender and race models share the same input. find their predictions in a single forward pass.
+	demography_actions = [action for action in ['age', 'gender', 'race'] if action in actions and action not in models]
+	
+	demography_model = None
+	if len(demography_actions) > 1 and engine == 'keras':
+		demography_model = registry.get_demography(demography_actions)
 	#---------------------------------
 
 	resp_objects = []
@@ -398,9 +389,70 @@ def analyze(img_path, actions = [], models = {}, enforce_detection = True, detec
 	
 	global_pbar = tqdm(range(0,len(img_paths)), desc='Analyzing', disable = disable_option)
 	
+	#faces of bulk images are detected in small chunks. ssd and mtcnn process a chunk in batches. cached faces are not detected again.
+	if bulkProcess == True:
+		image_chunks = functions.find_faces_chunks(img_paths, detector_backend = detector_backend, use_cache = all_faces != True)
+	
 	#for img_path in img_paths:
 	for j in global_pbar:
 		img_path = img_paths[j]
+		
+		image_faces = None; cache_key = None; decode_scale = None
+		if bulkProcess == True:
+			img_path, image_faces, cache_key, decode_scale = next(image_chunks)
+		
+		if all_faces == True:
+			
+			#faces are detected once. each model runs a single forward pass for all faces in the image.
+			
+			img_224, faces = functions.preprocess_faces(img = img_path, target_size = (224, 224), grayscale = False, enforce_detection = enforce_detection, detector_backend = detector_backend, faces = image_faces, decode_scale = decode_scale)
+			
+			face_objs = []
+			for face in faces:
+				x, y, w, h = face["box"]
+				face_objs.append({"region": {"x": x, "y": y, "w": w, "h": h}})
+			
+			if 'emotion' in actions:
+				img_48 = np.concatenate([functions.postprocess_face(face["face"], target_size = (48, 48), grayscale = True) for face in faces], axis = 0)
+				
+				emotion_predictions = functions.predict(emotion_model, img_48)
+				
+				for i in range(0, len(faces)):
+					sum_of_predictions = emotion_predictions[i].sum()
+					face_objs[i]["emotion"] = dict((emotion_labels[k], float(100 * emotion_predictions[i][k] / sum_of_predictions)) for k in range(0, len(emotion_labels)))
+					face_objs[i]["dominant_emotion"] = emotion_labels[np.argmax(emotion_predictions[i])]
+			
+			demography_predictions = {}
+			if demography_model is not None:
+				demography_predictions = dict(zip(demography_actions, functions.predict(demography_model, img_224)))
+			
+			if 'age' in actions:
+				age_predictions = demography_predictions['age'] if 'age' in demography_predictions else functions.predict(age_model, img_224)
+				
+				for i in range(0, len(faces)):
+					face_objs[i]["age"] = float(Age.findApparentAge(age_predictions[i]))
+			
+			if 'gender' in actions:
+				gender_predictions = demography_predictions['gender'] if 'gender' in demography_predictions else functions.predict(gender_model, img_224)
+				
+				for i in range(0, len(faces)):
+					face_objs[i]["gender"] = "Woman" if np.argmax(gender_predictions[i]) == 0 else "Man"
+			
+			if 'race' in actions:
+				race_predictions = demography_predictions['race'] if 'race' in demography_predictions else functions.predict(race_model, img_224)
+				
+				for i in range(0, len(faces)):
+					sum_of_predictions = race_predictions[i].sum()
+					face_objs[i]["race"] = dict((race_labels[k], float(100 * race_predictions[i][k] / sum_of_predictions)) for k in range(0, len(race_labels)))
+					face_objs[i]["dominant_race"] = race_labels[np.argmax(race_predictions[i])]
+			
+			if bulkProcess == True:
+				resp_objects.append(face_objs)
+				continue
+			else:
+				return face_objs
+		
+		#---------------------------------
 
 		resp_obj = "{"
 		
@@ -410,6 +462,12 @@ def analyze(img_path, actions = [], models = {}, enforce_detection = True, detec
 
 		action_idx = 0
 		img_224 = None # Set to prevent re-detection
+		
+		demography_predictions = {}
+		if demography_model is not None:
+			img_224 = functions.preprocess_face(img = img_path, target_size = (224, 224), grayscale = False, enforce_detection = enforce_detection, detector_backend = detector_backend, faces = image_faces, cache_key = cache_key)
+			demography_predictions = dict(zip(demography_actions, functions.predict(demography_model, img_224)))
+		
 		#for action in actions:
 		for index in pbar:
 			action = actions[index]
@@ -419,10 +477,9 @@ def analyze(img_path, actions = [], models = {}, enforce_detection = True, detec
 				resp_obj += ", "
 
 			if action == 'emotion':
-				emotion_labels = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
-				img = functions.preprocess_face(img = img_path, target_size = (48, 48), grayscale = True, enforce_detection = enforce_detection, detector_backend = detector_backend)
+				img = functions.preprocess_face(img = img_path, target_size = (48, 48), grayscale = True, enforce_detection = enforce_detection, detector_backend = detector_backend, faces = image_faces, cache_key = cache_key)
 
-				emotion_predictions = emotion_model.predict(img)[0,:]
+				emotion_predictions = functions.predict(emotion_model, img)[0,:]
 
 				sum_of_predictions = emotion_predictions.sum()
 
@@ -443,19 +500,25 @@ def analyze(img_path, actions = [], models = {}, enforce_detection = True, detec
 
 			elif action == 'age':
 				if img_224 is None:
-					img_224 = functions.preprocess_face(img_path, target_size = (224, 224), grayscale = False, enforce_detection = enforce_detection) #just emotion model expects grayscale images
+					img_224 = functions.preprocess_face(img = img_path, target_size = (224, 224), grayscale = False, enforce_detection = enforce_detection, detector_backend = detector_backend, faces = image_faces, cache_key = cache_key) #just emotion model expects grayscale images
 				#print("age prediction")
-				age_predictions = age_model.predict(img_224)[0,:]
+				if 'age' in demography_predictions:
+					age_predictions = demography_predictions['age'][0,:]
+				else:
+					age_predictions = functions.predict(age_model, img_224)[0,:]
 				apparent_age = Age.findApparentAge(age_predictions)
 
 				resp_obj += "\"age\": %s" % (apparent_age)
 
 			elif action == 'gender':
 				if img_224 is None:
-					img_224 = functions.preprocess_face(img = img_path, target_size = (224, 224), grayscale = False, enforce_detection = enforce_detection, detector_backend = detector_backend) #just emotion model expects grayscale images
+					img_224 = functions.preprocess_face(img = img_path, target_size = (224, 224), grayscale = False, enforce_detection = enforce_detection, detector_backend = detector_backend, faces = image_faces, cache_key = cache_key) #just emotion model expects grayscale images
 				#print("gender prediction")
 
-				gender_prediction = gender_model.predict(img_224)[0,:]
+				if 'gender' in demography_predictions:
+					gender_prediction = demography_predictions['gender'][0,:]
+				else:
+					gender_prediction = functions.predict(gender_model, img_224)[0,:]
 
 				if np.argmax(gender_prediction) == 0:
 					gender = "Woman"
@@ -466,9 +529,11 @@ def analyze(img_path, actions = [], models = {}, enforce_detection = True, detec
 
 			elif action == 'race':
 				if img_224 is None:
-					img_224 = functions.preprocess_face(img = img_path, target_size = (224, 224), grayscale = False, enforce_detection = enforce_detection, detector_backend = detector_backend) #just emotion model expects grayscale images
-				race_predictions = race_model.predict(img_224)[0,:]
-				race_labels = ['asian', 'indian', 'black', 'white', 'middle eastern', 'latino hispanic']
+					img_224 = functions.preprocess_face(img = img_path, target_size = (224, 224), grayscale = False, enforce_detection = enforce_detection, detector_backend = detector_backend, faces = image_faces, cache_key = cache_key) #just emotion model expects grayscale images
+				if 'race' in demography_predictions:
+					race_predictions = demography_predictions['race'][0,:]
+				else:
+					race_predictions = functions.predict(race_model, img_224)[0,:]
 
 				sum_of_predictions = race_predictions.sum()
 
@@ -517,13 +582,63 @@ def detectFace(img_path, detector_backend = 'opencv'):
 	img = functions.preprocess_face(img = img_path, detector_backend = detector_backend)[0] #preprocess_face returns (1, 224, 224, 3)
 	return img[:, :, ::-1] #bgr to rgb
 
-def find(img_path, db_path, model_name ='VGG-Face', distance_metric = 'cosine', model = None, enforce_detection = True, detector_backend = 'opencv'):
+def detect_faces(img_path, detector_backend = 'opencv', align = True):
+	
+	#returns every face in the image with a single detector pass. each item has box (x, y, w, h), confidence, landmarks and face.
+	#faces are in rgb and in their own sizes. confidence and landmarks are None if the detector does not provide them.
+	
+	faces = functions.detect_faces(img_path, detector_backend = detector_backend, align = align)
+	
+	for face in faces:
+		face["face"] = face["face"][:, :, ::-1] #bgr to rgb
+	
+	return faces
+
+def represent(img_path, model_name = 'VGG-Face', model = None, enforce_detection = True, detector_backend = 'opencv', precision = 'float32', engine = 'keras', all_faces = False):
+	
+	#returns the vector representation of the face in the image.
+	#all_faces represents every face in the image in a single call and returns a list of regions and embeddings.
+	
+	if model_name == 'Ensemble':
+		raise ValueError("Ensemble learning combines distances of several models. Represent a face with a single model.")
+	
+	if model == None:
+		model = build_model(model_name, precision, engine)
+	
+	if model_name == 'Dlib': #this is not a regular keras model
+		input_shape = (150, 150, 3)
+	else:
+		input_shape = functions.find_input_shape(model)
+	
+	input_shape_x = input_shape[0]; input_shape_y = input_shape[1]
+	
+	if all_faces != True:
+		img = functions.preprocess_face(img = img_path, target_size = (input_shape_y, input_shape_x), enforce_detection = enforce_detection, detector_backend = detector_backend, rgb_uint8 = model_name == 'Dlib')
+		return functions.predict(model, img)[0,:].tolist()
+	
+	img, faces = functions.preprocess_faces(img = img_path, target_size = (input_shape_y, input_shape_x), enforce_detection = enforce_detection, detector_backend = detector_backend, rgb_uint8 = model_name == 'Dlib')
+	
+	embeddings = functions.predict(model, img)
+	
+	resp_obj = []
+	for i in range(0, len(faces)):
+		x, y, w, h = faces[i]["box"]
+		resp_obj.append({"region": {"x": x, "y": y, "w": w, "h": h}, "embedding": embeddings[i].tolist()})
+	
+	return resp_obj
+
+def find(img_path, db_path, model_name ='VGG-Face', distance_metric = 'cosine', model = None, enforce_detection = True, detector_backend = 'opencv', precision = 'float32', engine = 'keras', all_faces = False):
+	
+	#all_faces searches every face in an image. a list of data frames, one for each face, is returned for each image.
 	
 	model_names = ['VGG-Face', 'Facenet', 'OpenFace', 'DeepFace']
 	metric_names = ['cosine', 'euclidean', 'euclidean_l2']
 	
 	tic = time.time()
 	
+	if all_faces == True and model_name == 'Ensemble':
+		raise ValueError("Searching all faces in an image is available for single models but ensemble learning is enabled")
+	
 	if type(img_path) == list:
 		bulkProcess = True
 		img_paths = img_path.copy()
@@ -538,46 +653,35 @@ def find(img_path, db_path, model_name ='VGG-Face', distance_metric = 'cosine',
 		if model == None:
 			if model_name == 'VGG-Face':
 				print("Using VGG-Face model backend and", distance_metric,"distance.")
-				model = VGGFace.loadModel()
+				model = build_model("VGG-Face", precision, engine)
 			elif model_name == 'OpenFace':
 				print("Using OpenFace model backend", distance_metric,"distance.")
-				model = OpenFace.loadModel()
+				model = build_model("OpenFace", precision, engine)
 			elif model_name == 'Facenet':
 				print("Using Facenet model backend", distance_metric,"distance.")
-				model = Facenet.loadModel()
+				model = build_model("Facenet", precision, engine)
 			elif model_name == 'DeepFace':
 				print("Using FB DeepFace model backend", distance_metric,"distance.")
-				model = FbDeepFace.loadModel()
+				model = build_model("DeepFace", precision, engine)
 			elif model_name == 'DeepID':
 				print("Using DeepID model backend", distance_metric,"distance.")
-				model = DeepID.loadModel()
+				model = build_model("DeepID", precision, engine)
 			elif model_name == 'Dlib':
 				print("Using Dlib ResNet model backend", distance_metric,"distance.")
-				from deepface.basemodels.DlibResNet import DlibResNet #this is not a must because it is very huge
-				model = DlibResNet()
+				model = build_model("Dlib", precision, engine)
 			elif model_name == 'Ensemble':
 				print("Ensemble learning enabled")
 				#TODO: include DeepID in ensemble method
 				
 				import lightgbm as lgb #lightgbm==2.3.1
 				
-				models = {}
-				
-				pbar = tqdm(range(0, len(model_names)), desc='Face recognition models')
-				
-				for index in pbar:
-					if index == 0:
-						pbar.set_description("Loading VGG-Face")
-						models['VGG-Face'] = VGGFace.loadModel()
-					elif index == 1:
-						pbar.set_description("Loading FaceNet")
-						models['Facenet'] = Facenet.loadModel()
-					elif index == 2:
-						pbar.set_description("Loading OpenFace")
-						models['OpenFace'] = OpenFace.loadModel()
-					elif index == 3:
-						pbar.set_description("Loading DeepFace")
-						models['DeepFace'] = FbDeepFace.loadModel()
+				if precision != 'float32':
+					raise ValueError("Reduced precision is available for single models but ensemble learning is enabled")
+				
+				if engine == 'keras':
+					models = registry.get_many(model_names)
+				else:
+					models = dict((ensemble_model_name, build_model(ensemble_model_name, engine = engine)) for ensemble_model_name in model_names)
 						
 			else:
 				raise ValueError("Invalid model_name passed - ", model_name)	
@@ -606,6 +710,10 @@ def find(img_path, db_path, model_name ='VGG-Face', distance_metric = 'cosine',
 		#---------------------------------------
 		
 		file_name = "representations_%s.pkl" % (model_name)
+		
+		if precision != 'float32': #representations of reduced precision models must not be mixed with the regular ones
+			file_name = "representations_%s_%s.pkl" % (model_name, precision)
+		
 		file_name = file_name.replace("-", "_").lower()
 		
 		if path.exists(db_path+"/"+file_name):
@@ -634,6 +742,10 @@ def find(img_path, db_path, model_name ='VGG-Face', distance_metric = 'cosine',
 			
 			representations = []
 			
+			#faces are represented in batches. keras models run a single forward pass and dlib computes descriptors of a batch in a single call.
+			batch_size = 32
+			batch_employees = []
+			
 			pbar = tqdm(range(0,len(employees)), desc='Finding representations')
 			
 			#for employee in employees:
@@ -647,23 +759,27 @@ def find(img_path, db_path, model_name ='VGG-Face', distance_metric = 'cosine',
 					else:
 						#input_shape = model.layers[0].input_shape[1:3] #my environment returns (None, 224, 224, 3) but some people mentioned that they got [(None, 224, 224, 3)]. I think this is because of version issue.
 						
-						input_shape = model.layers[0].input_shape
-						
-						if type(input_shape) == list:
-							input_shape = input_shape[0][1:3]
-						else:
-							input_shape = input_shape[1:3]
+						input_shape = functions.find_input_shape(model)
 					
 					#---------------------
 					
 					input_shape_x = input_shape[0]; input_shape_y = input_shape[1]
 					
-					img = functions.preprocess_face(img = employee, target_size = (input_shape_y, input_shape_x), enforce_detection = enforce_detection, detector_backend = detector_backend)
-					representation = model.predict(img)[0,:]
+					batch_employees.append(employee)
 					
-					instance = []
-					instance.append(employee)
-					instance.append(representation)
+					if len(batch_employees) == batch_size or index == len(employees) - 1:
+						#ssd detects faces of the batch in a single forward pass as well
+						batch_imgs = functions.preprocess_face_batch(batch_employees, target_size = (input_shape_y, input_shape_x), enforce_detection = enforce_detection, detector_backend = detector_backend, rgb_uint8 = model_name == 'Dlib')
+						
+						batch_representations = functions.predict(model, batch_imgs)
+						
+						for i in range(0, len(batch_employees)):
+							instance = []
+							instance.append(batch_employees[i])
+							instance.append(batch_representations[i])
+							representations.append(instance)
+						
+						batch_employees = []
 					
 				else: #ensemble learning
 					
@@ -675,22 +791,17 @@ def find(img_path, db_path, model_name ='VGG-Face', distance_metric = 'cosine',
 						
 						#input_shape = model.layers[0].input_shape[1:3] #my environment returns (None, 224, 224, 3) but some people mentioned that they got [(None, 224, 224, 3)]. I think this is because of version issue.
 	
-						input_shape = ensemble_model.layers[0].input_shape
-						
-						if type(input_shape) == list:
-							input_shape = input_shape[0][1:3]
-						else:
-							input_shape = input_shape[1:3]
+						input_shape = functions.find_input_shape(ensemble_model)
 						
 						input_shape_x = input_shape[0]; input_shape_y = input_shape[1]
 						
 						img = functions.preprocess_face(img = employee, target_size = (input_shape_y, input_shape_x), enforce_detection = enforce_detection, detector_backend = detector_backend)
-						representation = ensemble_model.predict(img)[0,:]
+						representation = functions.predict(ensemble_model, img)[0,:]
 						instance.append(representation)
-				
-				#-------------------------------
-				
-				representations.append(instance)
+					
+					#-------------------------------
+					
+					representations.append(instance)
 			
 			f = open(db_path+'/'+file_name, "wb")
 			pickle.dump(representations, f)
@@ -722,15 +833,10 @@ def find(img_path, db_path, model_name ='VGG-Face', distance_metric = 'cosine',
 					
 					#input_shape = ensemble_model.layers[0].input_shape[1:3] #my environment returns (None, 224, 224, 3) but some people mentioned that they got [(None, 224, 224, 3)]. I think this is because of version issue.
 	
-					input_shape = ensemble_model.layers[0].input_shape
-					
-					if type(input_shape) == list:
-						input_shape = input_shape[0][1:3]
-					else:
-						input_shape = input_shape[1:3]
+					input_shape = functions.find_input_shape(ensemble_model)
 					
 					img = functions.preprocess_face(img = img_path, target_size = input_shape, enforce_detection = enforce_detection, detector_backend = detector_backend)
-					target_representation = ensemble_model.predict(img)[0,:]
+					target_representation = functions.predict(ensemble_model, img)[0,:]
 					
 					for k in metric_names:
 						distances = []
@@ -810,44 +916,52 @@ def find(img_path, db_path, model_name ='VGG-Face', distance_metric = 'cosine',
 				else:
 					#input_shape = model.layers[0].input_shape[1:3] #my environment returns (None, 224, 224, 3) but some people mentioned that they got [(None, 224, 224, 3)]. I think this is because of version issue.
 					
-					input_shape = model.layers[0].input_shape
-					
-					if type(input_shape) == list:
-						input_shape = input_shape[0][1:3]
-					else:
-						input_shape = input_shape[1:3]
+					input_shape = functions.find_input_shape(model)
 				
 				#------------------------
 				
 				input_shape_x = input_shape[0]; input_shape_y = input_shape[1]
 				
-				img = functions.preprocess_face(img = img_path, target_size = (input_shape_y, input_shape_x), enforce_detection = enforce_detection, detector_backend = detector_backend)
-				target_representation = model.predict(img)[0,:]
-		
-				distances = []
-				for index, instance in df.iterrows():
-					source_representation = instance["representation"]
+				if all_faces == True:
+					#all faces are represented in a single call
+					img = functions.preprocess_faces(img = img_path, target_size = (input_shape_y, input_shape_x), enforce_detection = enforce_detection, detector_backend = detector_backend, rgb_uint8 = model_name == 'Dlib')[0]
+				else:
+					img = functions.preprocess_face(img = img_path, target_size = (input_shape_y, input_shape_x), enforce_detection = enforce_detection, detector_backend = detector_backend, rgb_uint8 = model_name == 'Dlib')
+				
+				target_representations = functions.predict(model, img)
+				
+				face_dfs = []
+				
+				for target_representation in target_representations:
+					distances = []
+					for index, instance in df.iterrows():
+						source_representation = instance["representation"]
+						
+						if distance_metric == 'cosine':
+							distance = dst.findCosineDistance(source_representation, target_representation)
+						elif distance_metric == 'euclidean':
+							distance = dst.findEuclideanDistance(source_representation, target_representation)
+						elif distance_metric == 'euclidean_l2':
+							distance = dst.findEuclideanDistance(dst.l2_normalize(source_representation), dst.l2_normalize(target_representation))
+						else:
+							raise ValueError("Invalid distance_metric passed - ", distance_metric)
+						
+						distances.append(distance)
 					
-					if distance_metric == 'cosine':
-						distance = dst.findCosineDistance(source_representation, target_representation)
-					elif distance_metric == 'euclidean':
-						distance = dst.findEuclideanDistance(source_representation, target_representation)
-					elif distance_metric == 'euclidean_l2':
-						distance = dst.findEuclideanDistance(dst.l2_normalize(source_representation), dst.l2_normalize(target_representation))
-					else:
-						raise ValueError("Invalid distance_metric passed - ", distance_metric)
+					threshold = functions.findThreshold(model_name, distance_metric)
 					
-					distances.append(distance)
+					df["distance"] = distances
+					df = df.drop(columns = ["representation"])
+					df = df[df.distance <= threshold]
 				
-				threshold = functions.findThreshold(model_name, distance_metric)
+					df = df.sort_values(by = ["distance"], ascending=True).reset_index(drop=True)
+					face_dfs.append(df)
+					df = df_base.copy() #restore df for the next face
 				
-				df["distance"] = distances
-				df = df.drop(columns = ["representation"])
-				df = df[df.distance <= threshold]
-			
-				df = df.sort_values(by = ["distance"], ascending=True).reset_index(drop=True)
-				resp_obj.append(df)
-				df = df_base.copy() #restore df for the next iteration
+				if all_faces == True:
+					resp_obj.append(face_dfs)
+				else:
+					resp_obj.append(face_dfs[0])
 			
 		toc = time.time()
 		
@@ -869,9 +983,26 @@ def stream(db_path = '', model_name ='VGG-Face', distance_metric = 'cosine', ena
 	else:
 		realtime.analysis(db_path, model_name, distance_metric, enable_face_analysis)
 
-def allocateMemory():
+def build_model(model_name, precision = 'float32', engine = 'keras'):
+	
+	#models are built once per process and shared by verify, find, analyze and stream
+	#engine might be keras or opencv. opencv runs frozen graphs of keras models with cv2.dnn.
+	
+	if engine == 'opencv':
+		if precision != 'float32':
+			raise ValueError("OpenCV DNN engine runs float32 models but you passed ", precision)
+		
+		return opencv_dnn.build_model(model_name)
+	
+	elif engine != 'keras':
+		raise ValueError("Valid engines are keras and opencv but you passed ", engine)
+	
+	return quantization.build_model(model_name, precision)
+
+def allocateMemory(workers = None):
+	#workers is the number of processes running deepface on the same box. cpu cores are shared among them if it is passed.
 	print("Analyzing your system...")
-	functions.allocateMemory()
+	functions.allocateMemory(workers)
 
 #---------------------------
 #main
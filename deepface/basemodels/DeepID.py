@@ -6,6 +6,8 @@ from keras.models import Model
 from keras.layers import Conv2D, Activation, Input, Add, MaxPooling2D, Flatten, Dense, Dropout
 import zipfile
 
+from deepface.commons import weights
+
 #-------------------------------------
 
 def loadModel(url = 'https://drive.google.com/uc?id=1uRLtBCTQQAvHJ_KVrdbRJiCKxU8m5q2J'):
@@ -36,6 +38,9 @@ def loadModel(url = 'https://drive.google.com/uc?id=1uRLtBCTQQAvHJ_KVrdbRJiCKxU8
 	
 	model = Model(inputs=[myInput], outputs=y)
 
+	if weights.load_bundle(model, 'DeepID') == True:
+		return model
+
 	#---------------------------------
 	
 	home = str(Path.home())
@@ -4,8 +4,11 @@ import zipfile
 import bz2
 import gdown
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from deepface.commons import functions
+
 class DlibResNet:
 	
 	def __init__(self):
@@ -32,31 +35,50 @@ class DlibResNet:
 		
 		model = dlib.face_recognition_model_v1(weight_file)
 		self.__model = model
+		self.__weight_file = weight_file
+		
+		self.input_shape = (None, 150, 150, 3)
 		
 		#---------------------
 		
 		return None #classes must return None
 	
+	def memory_size(self):
+		#dlib keeps the network in its own memory. its size is close to the size of the weight file in MB.
+		return os.path.getsize(self.__weight_file) / (1024 * 1024)
+	
 	def predict(self, img_aligned):
 		
-		#functions.detectFace returns 4 dimensional images
-		if len(img_aligned.shape) == 4:
-			img_aligned = img_aligned[0]
-		
-		#functions.detectFace returns bgr images
-		img_aligned = img_aligned[:,:,::-1] #bgr to rgb
+		#img_aligned might be a single face or a batch of faces
+		if len(img_aligned.shape) == 3:
+			img_aligned = np.expand_dims(img_aligned, axis = 0)
 		
-		#deepface.detectFace returns an array in scale of [0, 1] but dlib expects in scale of [0, 255]
-		if img_aligned.max() <= 1:
-			img_aligned = img_aligned * 255
+		#uint8 inputs are already rgb chips (preprocess_face with rgb_uint8). they are consumed as is.
+		if img_aligned.dtype != np.uint8:
+			
+			#functions.detectFace returns bgr images
+			img_aligned = img_aligned[:,:,:,::-1] #bgr to rgb
+			
+			#deepface.detectFace returns an array in scale of [0, 1] but dlib expects in scale of [0, 255]
+			if img_aligned.max() <= 1:
+				img_aligned = img_aligned * 255
+			
+			img_aligned = img_aligned.astype(np.uint8)
 		
-		img_aligned = img_aligned.astype(np.uint8)
+		faces = [img_aligned[i] for i in range(0, img_aligned.shape[0])]
 		
 		model = self.__model
 		
-		img_representation = model.compute_face_descriptor(img_aligned)
+		if len(faces) == 1:
+			img_representations = [model.compute_face_descriptor(faces[0])]
+		else:
+			try:
+				#all faces are processed in a single dlib call
+				img_representations = model.compute_face_descriptor(faces)
+			except TypeError: #older dlib versions do not accept batches
+				with ThreadPoolExecutor(max_workers = min(len(faces), functions.find_thread_count())) as executor:
+					img_representations = list(executor.map(model.compute_face_descriptor, faces))
 		
-		img_representation = np.array(img_representation)
-		img_representation = np.expand_dims(img_representation, axis = 0)
+		img_representations = np.array([np.array(img_representation) for img_representation in img_representations])
 		
-		return img_representation
\ No newline at end of file
+		return img_representations
\ No newline at end of file
@@ -17,6 +17,8 @@ from keras.layers import MaxPooling2D
 from keras.layers import add
 from keras import backend as K
 
+from deepface.commons import weights, optimization
+
 def scaling(x, scale):
 	return x * scale
 
@@ -530,23 +532,29 @@ def InceptionResNetV2():
 
 	return model
 
-def loadModel(url = 'https://drive.google.com/uc?id=1971Xk5RwedbudGgTIrGAL4F7Aifu7id1'):
+def loadModel(url = 'https://drive.google.com/uc?id=1971Xk5RwedbudGgTIrGAL4F7Aifu7id1', fold_batchnorm = False):
 	model = InceptionResNetV2()
 	
-	#-----------------------------------
-	
-	home = str(Path.home())
-	
-	if os.path.isfile('configuration_files/facenet_weights.h5') != True:
-		print("facenet_weights.h5 will be downloaded...")
+	if weights.load_bundle(model, 'Facenet') != True:
+		
+		#-----------------------------------
 		
-		output = home+'/.deepface/weights/facenet_weights.h5'
-		gdown.download(url, output, quiet=False)
+		home = str(Path.home())
+		
+		if os.path.isfile('configuration_files/facenet_weights.h5') != True:
+			print("facenet_weights.h5 will be downloaded...")
+			
+			output = home+'/.deepface/weights/facenet_weights.h5'
+			gdown.download(url, output, quiet=False)
+		
+		#-----------------------------------
+		
+		model.load_weights("configuration_files/facenet_weights.h5")
 	
 	#-----------------------------------
+	#batch normalization layers are pure inference overhead once weights are frozen
 	
-	model.load_weights("configuration_files/facenet_weights.h5")
-	
-	#-----------------------------------
+	if fold_batchnorm == True:
+		model = optimization.fold_batchnorm(model, custom_objects = {'scaling': scaling})
 	
 	return model
\ No newline at end of file
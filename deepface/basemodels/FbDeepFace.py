@@ -6,9 +6,11 @@ from keras.models import Model, Sequential
 from keras.layers import Convolution2D, LocallyConnected2D, MaxPooling2D, Flatten, Dense, Dropout
 import zipfile
 
+from deepface.commons import weights
+
 #-------------------------------------
 
-def loadModel(url = 'https://github.com/swghosh/DeepFace/releases/download/weights-vggface2-2d-aligned/VGGFace2_DeepFace_weights_val-0.9034.h5.zip'):
+def baseModel():
 	base_model = Sequential()
 	base_model.add(Convolution2D(32, (11, 11), activation='relu', name='C1', input_shape=(152, 152, 3)))
 	base_model.add(MaxPooling2D(pool_size=3, strides=2, padding='same', name='M2'))
@@ -18,8 +20,18 @@ def loadModel(url = 'https://github.com/swghosh/DeepFace/releases/download/weigh
 	base_model.add(LocallyConnected2D(16, (5, 5), activation='relu', name='L6'))
 	base_model.add(Flatten(name='F0'))
 	base_model.add(Dense(4096, activation='relu', name='F7'))
-	base_model.add(Dropout(rate=0.5, name='D0'))
-	base_model.add(Dense(8631, activation='softmax', name='F8'))
+	
+	#D0 and F8 (8631 classes) are used in training only. F7 is the representation layer.
+	
+	return base_model
+
+def loadModel(url = 'https://github.com/swghosh/DeepFace/releases/download/weights-vggface2-2d-aligned/VGGFace2_DeepFace_weights_val-0.9034.h5.zip'):
+	
+	#classifier is not built. its 35M parameters would be loaded and discarded otherwise.
+	deepface_model = baseModel()
+	
+	if weights.load_bundle(deepface_model, 'DeepFace') == True:
+		return deepface_model
 	
 	#---------------------------------
 	
@@ -36,9 +48,7 @@ def loadModel(url = 'https://github.com/swghosh/DeepFace/releases/download/weigh
 		with zipfile.ZipFile(output, 'r') as zip_ref:
 			zip_ref.extractall(home+'/.deepface/weights/')
 		
-	base_model.load_weights(home+'/.deepface/weights/VGGFace2_DeepFace_weights_val-0.9034.h5')	
-	
-	#drop F8 and D0. F7 is the representation layer.
-	deepface_model = Model(inputs=base_model.layers[0].input, outputs=base_model.layers[-3].output)
+	#weights file still stores F8. layers are matched by their names.
+	deepface_model.load_weights(home+'/.deepface/weights/VGGFace2_DeepFace_weights_val-0.9034.h5', by_name = True)
 		
 	return deepface_model
\ No newline at end of file
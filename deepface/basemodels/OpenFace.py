@@ -13,9 +13,11 @@ from keras.layers.normalization import BatchNormalization
 from keras.models import load_model
 from keras import backend as K
 
+from deepface.commons import weights, optimization
+
 #---------------------------------------
 
-def loadModel(url = 'https://drive.google.com/uc?id=1LSe1YCV1x-BfNnfb7DFZTNpv_Q9jITxn'):
+def loadModel(url = 'https://drive.google.com/uc?id=1LSe1YCV1x-BfNnfb7DFZTNpv_Q9jITxn', fold_batchnorm = False):
 	myInput = Input(shape=(96, 96, 3))
 
 	x = ZeroPadding2D(padding=(3, 3), input_shape=(96, 96, 3))(myInput)
@@ -230,20 +232,26 @@ def loadModel(url = 'https://drive.google.com/uc?id=1LSe1YCV1x-BfNnfb7DFZTNpv_Q9
 	# Final Model
 	model = Model(inputs=[myInput], outputs=norm_layer)
 	
-	#-----------------------------------
-	
-	home = str(Path.home())
-	
-	if os.path.isfile(home+'/.deepface/weights/openface_weights.h5') != True:
-		print("openface_weights.h5 will be downloaded...")
+	if weights.load_bundle(model, 'OpenFace') != True:
+		
+		#-----------------------------------
 		
-		output = home+'/.deepface/weights/openface_weights.h5'
-		gdown.download(url, output, quiet=False)
+		home = str(Path.home())
+		
+		if os.path.isfile(home+'/.deepface/weights/openface_weights.h5') != True:
+			print("openface_weights.h5 will be downloaded...")
+			
+			output = home+'/.deepface/weights/openface_weights.h5'
+			gdown.download(url, output, quiet=False)
+		
+		#-----------------------------------
+		
+		model.load_weights(home+'/.deepface/weights/openface_weights.h5')
 	
 	#-----------------------------------
+	#merge each batch normalization layer into the conv layer it follows
 	
-	model.load_weights(home+'/.deepface/weights/openface_weights.h5')
-	
-	#-----------------------------------
+	if fold_batchnorm == True:
+		model = optimization.fold_batchnorm(model)
 	
 	return model
\ No newline at end of file
@@ -4,9 +4,14 @@ from keras.models import Model, Sequential
 from keras.layers import Input, Convolution2D, ZeroPadding2D, MaxPooling2D, Flatten, Dense, Dropout, Activation
 import gdown
 
+from deepface.commons import weights
+
 #---------------------------------------
 
-def baseModel():
+def featureModel():
+	
+	#convolutional blocks and fully connected layers of vgg-face without its classifier. facial attribute models are built on top of this.
+	
 	model = Sequential()
 	model.add(ZeroPadding2D((1,1),input_shape=(224,224, 3)))
 	model.add(Convolution2D(64, (3, 3), activation='relu'))
@@ -48,15 +53,34 @@ def baseModel():
 	model.add(Dropout(0.5))
 	model.add(Convolution2D(4096, (1, 1), activation='relu'))
 	model.add(Dropout(0.5))
+	
+	return model
+
+def descriptorModel():
+	
+	#vgg-face representation is the output of the last conv layer before softmax
+	
+	model = featureModel()
 	model.add(Convolution2D(2622, (1, 1)))
 	model.add(Flatten())
+	
+	return model
+
+def baseModel():
+	model = descriptorModel()
 	model.add(Activation('softmax'))
 	
 	return model
 
 def loadModel(url = 'https://drive.google.com/uc?id=1CPSeum3HpopfomUEK1gybeuIVoeJT_Eo'):
 	
-	model = baseModel()
+	#softmax is not built because it has no weights and the descriptor is its input
+	vgg_face_descriptor = descriptorModel()
+	
+	#-----------------------------------
+	
+	if weights.load_bundle(vgg_face_descriptor, 'VGG-Face') == True:
+		return vgg_face_descriptor
 	
 	#-----------------------------------
 	
@@ -70,11 +94,8 @@ def loadModel(url = 'https://drive.google.com/uc?id=1CPSeum3HpopfomUEK1gybeuIVoe
 	
 	#-----------------------------------
 	
-	model.load_weights(home+'/.deepface/weights/vgg_face_weights.h5')
+	vgg_face_descriptor.load_weights(home+'/.deepface/weights/vgg_face_weights.h5')
 	
 	#-----------------------------------
 	
-	#TO-DO: why?
-	vgg_face_descriptor = Model(inputs=model.layers[0].input, outputs=model.layers[-2].output)
-	
 	return vgg_face_descriptor
\ No newline at end of file
@@ -0,0 +1,219 @@
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+
+#---------------------------------------
+#content addressed cache of aligned faces. an image is detected and aligned once for a detector backend.
+#later requests for the same content derive every target size, grayscale or rgb variant from the cached face.
+#memory tier is an lru bounded in MB. faces can be stored in a directory as well to share them among processes and restarts.
+#cache is disabled by default. inputs are hashed in each call once it is configured, even if they are never seen again.
+
+entries = OrderedDict() #key -> {"box", "eyes", "face"}, least recently used first
+entry_sizes = {} #key -> MB
+
+memory_budget = 0 #MB. 0 disables the memory tier.
+cache_path = None #directory of the disk tier. None disables it.
+
+hits = 0
+misses = 0
+
+lock = threading.Lock()
+
+#---------------------------------------
+
+def configure(budget = 64, path = None):
+
+	#budget is in MB. pass 0 and None to disable the cache.
+
+	global memory_budget, cache_path
+
+	if budget is None or budget < 0:
+		raise ValueError("Memory budget of face cache must be 0 or a positive number of MB but you passed ", budget)
+
+	if path is not None and not os.path.exists(path):
+		os.makedirs(path)
+
+	with lock:
+		memory_budget = budget
+		cache_path = path
+		enforce_memory_budget()
+
+def enabled():
+	return memory_budget > 0 or cache_path is not None
+
+def find_key(img, settings):
+
+	#img might be path, base64 or numpy array. files and base64 strings are hashed as they are without decoding them.
+	#settings change the detected or aligned face, e.g. detector backend. they are a part of the key.
+
+	hasher = hashlib.sha1()
+
+	if type(img).__module__ == np.__name__:
+		img = np.ascontiguousarray(img)
+		hasher.update(str((img.shape, img.dtype.str)).encode())
+		hasher.update(img.data)
+
+	elif len(img) > 11 and img[0:11] == "data:image/":
+		hasher.update(img.encode())
+
+	else:
+		if os.path.isfile(img) != True:
+			return None #load_image raises the error
+
+		with open(img, 'rb') as f:
+			for chunk in iter(lambda: f.read(1024 * 1024), b''):
+				hasher.update(chunk)
+
+	hasher.update(str(settings).encode())
+
+	return hasher.hexdigest()
+
+def enforce_memory_budget():
+
+	#caller must hold the lock
+
+	while len(entries) > 0 and sum(entry_sizes.values()) > memory_budget:
+		key, entry = entries.popitem(last = False)
+		del entry_sizes[key]
+
+#---------------------------------------
+
+def get(key):
+
+	#returns the cached entry or None
+
+	global hits, misses
+
+	if key is None:
+		return None
+
+	with lock:
+		if key in entries:
+			entries.move_to_end(key)
+			hits = hits + 1
+			return entries[key]
+
+	entry = load(key)
+
+	with lock:
+		if entry is None:
+			misses = misses + 1
+			return None
+
+		hits = hits + 1
+
+	store(key, entry)
+
+	return entry
+
+def contains(key):
+
+	#checks both tiers without updating statistics or the order of entries
+
+	if key is None:
+		return False
+
+	with lock:
+		if key in entries:
+			return True
+
+	return cache_path is not None and os.path.isfile(get_entry_path(key))
+
+def put(key, box, eyes, face):
+
+	#face must not be a view of the image it is cropped from. otherwise, the whole image is kept in memory.
+
+	if key is None:
+		return
+
+	entry = {"box": tuple(int(value) for value in box), "eyes": eyes, "face": face}
+
+	store(key, entry)
+
+	if cache_path is not None:
+		save(key, entry)
+
+def store(key, entry):
+
+	size = entry["face"].nbytes / (1024 * 1024)
+
+	with lock:
+		if size > memory_budget:
+			return
+
+		entries[key] = entry
+		entry_sizes[key] = size
+		entries.move_to_end(key)
+		enforce_memory_budget()
+
+#---------------------------------------
+
+def get_entry_path(key):
+	return os.path.join(cache_path, key + '.npz')
+
+def save(key, entry):
+
+	entry_path = get_entry_path(key)
+
+	eyes = np.array(entry["eyes"], dtype = np.float64) if entry["eyes"] is not None else np.empty((0, 2))
+
+	#write into a temporary file first. other processes should never read a partially written entry.
+	#each writer has its own temporary file because processes sharing the directory might store the same entry at the same time.
+	fd, tmp_path = tempfile.mkstemp(dir = cache_path, suffix = '.tmp')
+
+	try:
+		with os.fdopen(fd, 'wb') as f:
+			np.savez(f, box = np.array(entry["box"]), eyes = eyes, face = entry["face"])
+
+		os.replace(tmp_path, entry_path)
+	except:
+		if os.path.isfile(tmp_path):
+			os.remove(tmp_path)
+		raise
+
+def load(key):
+
+	#returns None if the disk tier is disabled or the entry is not stored. unreadable entries are misses as well.
+
+	if cache_path is None:
+		return None
+
+	entry_path = get_entry_path(key)
+
+	if os.path.isfile(entry_path) != True:
+		return None
+
+	try:
+		with np.load(entry_path, allow_pickle = False) as data:
+			eyes = data["eyes"]
+
+			entry = {}
+			entry["box"] = tuple(int(value) for value in data["box"])
+			entry["eyes"] = (tuple(eyes[0]), tuple(eyes[1])) if eyes.shape[0] == 2 else None
+			entry["face"] = data["face"]
+	except Exception as err:
+		print("WARNING: ", entry_path," cannot be read. It is skipped: ", str(err))
+		return None
+
+	return entry
+
+#---------------------------------------
+
+def clear():
+
+	#clears the memory tier. files of the disk tier are kept.
+
+	global hits, misses
+
+	with lock:
+		entries.clear()
+		entry_sizes.clear()
+		hits = 0
+		misses = 0
+
+def stats():
+	with lock:
+		return {"entries": len(entries), "size": sum(entry_sizes.values()), "hits": hits, "misses": misses}
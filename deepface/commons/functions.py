@@ -12,18 +12,24 @@ import math
 from PIL import Image
 import copy
 import base64
+import io
 import multiprocessing
 import subprocess
+import threading
 import tensorflow as tf
 import keras
 import bz2
-from . import distance
+from . import distance, mtcnn_batch, face_cache
 from mtcnn import MTCNN #0.1.0
 
-def loadBase64Img(uri):
+def loadBase64Img(uri, return_scale = False):
    encoded_data = uri.split(',')[1]
-   nparr = np.fromstring(base64.b64decode(encoded_data), np.uint8)
-   img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+   data = base64.b64decode(encoded_data)
+   nparr = np.fromstring(data, np.uint8)
+   flag = find_decode_flag(io.BytesIO(data))
+   img = cv2.imdecode(nparr, flag)
+   if return_scale == True:
+      return img, 1 / decode_factors.get(flag, 1)
    return img
 
 def initializeFolder():
@@ -92,6 +98,37 @@ def findThreshold(model_name, distance_metric):
 	
 	return threshold
 
+def find_input_shape(model):
+	
+	#my environment returns (None, 224, 224, 3) but some people mentioned that they got [(None, 224, 224, 3)]. I think this is because of version issue.
+	
+	if hasattr(model, 'layers'): #keras based models
+		input_shape = model.layers[0].input_shape
+	else: #wrappers such as tflite models expose the shape of their input directly
+		input_shape = model.input_shape
+	
+	if type(input_shape) == list:
+		input_shape = input_shape[0][1:3]
+	else:
+		input_shape = input_shape[1:3]
+	
+	return tuple(input_shape)
+
+def predict(model, img):
+	
+	#keras predict has a large fixed cost in each call (data adapters, callbacks and batching loops).
+	#predict_on_batch runs the compiled predict function of the model directly. that's the common case of a single face.
+	
+	if hasattr(model, 'predict_on_batch'): #keras based models
+		prediction = model.predict_on_batch(img)
+		
+		if type(prediction) == list: #multi-output models
+			return [np.asarray(item) for item in prediction]
+		
+		return np.asarray(prediction)
+	
+	return model.predict(img) #dlib and tflite wrappers
+	
 def get_opencv_path():
 	opencv_home = cv2.__file__
 	folders = opencv_home.split(os.path.sep)[0:-1]
@@ -102,7 +139,11 @@ def get_opencv_path():
 	
 	return path+"/data/"
 
-def load_image(img):
+def load_image(img, return_scale = False):
+	
+	#return_scale returns the scale of the loaded image with respect to the original one as well. it is less than 1 for reduced resolution decoding.
+	
+	scale = 1
 	
 	exact_image = False
 	if type(img).__module__ == np.__name__:
@@ -115,54 +156,90 @@ def load_image(img):
 	#---------------------------
 	
 	if base64_img == True:
-		img = loadBase64Img(img)
+		img, scale = loadBase64Img(img, return_scale = True)
 		
 	elif exact_image != True: #image path passed as input
 		if os.path.isfile(img) != True:
 			raise ValueError("Confirm that ",img," exists")
 		
-		img = cv2.imread(img)
+		flag = find_decode_flag(img)
+		img = cv2.imread(img, flag)
+		scale = 1 / decode_factors.get(flag, 1)
+	
+	if return_scale == True:
+		return img, scale
 	
 	return img
+
+#------------------------------
+#reduced resolution decoding. jpeg files can be decoded at 1/2, 1/4 or 1/8 scale much faster and in less memory than in full resolution.
+#the smallest scale whose longest side is still min_decode_side or more is chosen. None decodes images in full resolution.
+#min_decode_side bounds the longest side of the image, not the size of faces. small faces in large group photos lose resolution as well.
+#regions returned by detect_faces and preprocess_faces are mapped back to the coordinates of the original image.
+
+min_decode_side = None
+
+reduced_decode_flags = [(8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)]
+decode_factors = dict((flag, factor) for factor, flag in reduced_decode_flags)
+
+def set_min_decode_side(side):
 	
-def detect_face(img, detector_backend = 'opencv', grayscale = False, enforce_detection = True):
+	global min_decode_side
 	
-	home = str(Path.home())
+	if side is not None and side <= 0:
+		raise ValueError("min_decode_side must be a positive number of pixels but you passed ", side)
 	
-	if detector_backend == 'opencv':
+	min_decode_side = side
+
+def find_decode_flag(source):
 	
-		#get opencv configuration up first
-		opencv_path = get_opencv_path()
-		face_detector_path = opencv_path+"haarcascade_frontalface_default.xml"
+	#source is an image path or a file object. only the header is read here to find the size of the image.
 	
-		if os.path.isfile(face_detector_path) != True:
-			raise ValueError("Confirm that opencv is installed on your environment! Expected path ",face_detector_path," violated.")
-		
-		face_detector = cv2.CascadeClassifier(face_detector_path)
+	if min_decode_side is None:
+		return cv2.IMREAD_COLOR
+	
+	try:
+		with Image.open(source) as header:
+			image_format = header.format
+			width, height = header.size
+	except:
+		return cv2.IMREAD_COLOR
+	
+	if image_format != 'JPEG': #other formats are decoded in full resolution and resized by opencv
+		return cv2.IMREAD_COLOR
+	
+	for factor, flag in reduced_decode_flags:
+		if max(width, height) / factor >= min_decode_side:
+			return flag
+	
+	return cv2.IMREAD_COLOR
+	
+#------------------------------
+#detectors and landmark predictors are built once per process. building them reads model files from disk.
+
+detector_obj = {} #detector name -> (detector, lock guarding its usage)
+detector_lock = threading.Lock()
+
+def build_detector(detector_name):
+	
+	home = str(Path.home())
 	
-		#--------------------------
+	if detector_name in ['opencv', 'eye']:
 		
-		faces = []
+		#get opencv configuration up first
+		opencv_path = get_opencv_path()
 		
-		try: 
-			faces = face_detector.detectMultiScale(img, 1.3, 5)
-		except:
-			pass
+		if detector_name == 'opencv':
+			detector_path = opencv_path+"haarcascade_frontalface_default.xml"
+		else:
+			detector_path = opencv_path+"haarcascade_eye.xml"
 		
-		if len(faces) > 0:
-			x,y,w,h = faces[0] #focus on the 1st face found in the image
-			detected_face = img[int(y):int(y+h), int(x):int(x+w)]
-			return detected_face
+		if os.path.isfile(detector_path) != True:
+			raise ValueError("Confirm that opencv is installed on your environment! Expected path ",detector_path," violated.")
 		
-		else: #if no face detected
+		return cv2.CascadeClassifier(detector_path)
 	
-			if enforce_detection != True:			
-				return img
-	
-			else:
-				raise ValueError("Face could not be detected. Please confirm that the picture is a face photo or consider to set enforce_detection param to False.")
-
-	elif detector_backend == 'ssd':
+	elif detector_name == 'ssd':
 		
 		#---------------------------
 		#check required ssd model exists in the home/.deepface/weights folder
@@ -192,113 +269,399 @@ def detect_face(img, detector_backend = 'opencv', grayscale = False, enforce_det
 			
 		#---------------------------
 		
-		ssd_detector = cv2.dnn.readNetFromCaffe(
+		return cv2.dnn.readNetFromCaffe(
 			home+"/.deepface/weights/deploy.prototxt", 
 			home+"/.deepface/weights/res10_300x300_ssd_iter_140000.caffemodel"
 		)
+	
+	elif detector_name == 'dlib':
+		import dlib #this is not a must library within deepface. that's why, I didn't put this import to a global level. version: 19.20.0
 		
-		ssd_labels = ["img_id", "is_face", "confidence", "left", "top", "right", "bottom"]
+		return dlib.get_frontal_face_detector()
+	
+	elif detector_name == 'dlib_shape_predictor':
 		
-		target_size = (300, 300)
+		#check required file exists in the home/.deepface/weights folder
+		
+		if os.path.isfile(home+'/.deepface/weights/shape_predictor_5_face_landmarks.dat') != True:
+			
+			print("shape_predictor_5_face_landmarks.dat.bz2 is going to be downloaded") 
+			
+			url = "http://dlib.net/files/shape_predictor_5_face_landmarks.dat.bz2"
+			output = home+'/.deepface/weights/'+url.split("/")[-1]
+			
+			gdown.download(url, output, quiet=False)
+			
+			zipfile = bz2.BZ2File(output)
+			data = zipfile.read()
+			newfilepath = output[:-4] #discard .bz2 extension
+			open(newfilepath, 'wb').write(data)
 		
-		base_img = img.copy() #we will restore base_img to img later
+		#------------------------------
+		
+		import dlib #this is not a must dependency in deepface
+		
+		return dlib.shape_predictor(home+"/.deepface/weights/shape_predictor_5_face_landmarks.dat")
+	
+	elif detector_name == 'mtcnn':
+		return MTCNN()
+	
+	else:
+		detectors = ['opencv', 'ssd', 'dlib', 'mtcnn']
+		raise ValueError("Valid backends are ", detectors," but you passed ", detector_name)
+
+def get_detector(detector_name):
+	
+	#returns the shared detector and its lock. cascades, dnn nets, dlib objects and mtcnn are not safe to call from concurrent threads.
+	
+	with detector_lock:
+		if detector_name not in detector_obj:
+			detector_obj[detector_name] = (build_detector(detector_name), threading.Lock())
+		
+		return detector_obj[detector_name]
+	
+def detect_face(img, detector_backend = 'opencv', grayscale = False, enforce_detection = True):
+	return detect_face_landmarks(img = img, detector_backend = detector_backend, grayscale = grayscale, enforce_detection = enforce_detection)[0]
+
+#------------------------------
+#detection on downscaled images. detectors run on a copy of large images whose longest side is max_detection_side.
+#boxes and landmarks are mapped back and faces are still cropped from the full resolution image. None disables it.
+
+max_detection_side = None
+
+def set_max_detection_side(side):
+	
+	global max_detection_side
+	
+	if side is not None and side <= 0:
+		raise ValueError("max_detection_side must be a positive number of pixels but you passed ", side)
+	
+	max_detection_side = side
+
+def resize_for_detection(img):
+	
+	#returns the image detectors run on and its scale with respect to img
+	
+	if max_detection_side is None or max(img.shape[0:2]) <= max_detection_side:
+		return img, 1
+	
+	scale = max_detection_side / max(img.shape[0:2])
+	
+	dsize = (max(1, int(round(img.shape[1] * scale))), max(1, int(round(img.shape[0] * scale))))
+	
+	return cv2.resize(img, dsize, interpolation = cv2.INTER_AREA), scale
+
+def scale_faces(faces, scale):
+	
+	#maps boxes and landmarks found in a downscaled image back to the coordinates of the original one
+	
+	if scale == 1:
+		return faces
+	
+	for face in faces:
+		x, y, w, h = face["box"]
+		
+		left = int(round(x / scale)); top = int(round(y / scale))
+		right = int(round((x + w) / scale)); bottom = int(round((y + h) / scale))
+		
+		face["box"] = (left, top, right - left, bottom - top)
+		
+		landmarks = face["landmarks"]
+		
+		if type(landmarks) == dict:
+			face["landmarks"] = dict((key, (int(round(point[0] / scale)), int(round(point[1] / scale)))) for key, point in landmarks.items())
+		elif landmarks is not None:
+			face["landmarks"] = [(int(round(point[0] / scale)), int(round(point[1] / scale))) for point in landmarks]
+	
+	return faces
+
+def find_faces(img, detector_backend = 'opencv'):
+	
+	#runs the detector once and returns every face found in img in the order of the detector.
+	#each face is a dictionary of box (x, y, w, h), confidence and landmarks in the coordinates of img.
+	#mtcnn landmarks are its keypoints. dlib landmarks are the points of the 5 point shape predictor found by find_landmarks on demand.
+	#confidence and landmarks are None for the detectors not providing them.
+	
+	faces = []
+	
+	if detector_backend == 'opencv':
+		
+		face_detector, lock = get_detector('opencv')
+		
+		detection_img, scale = resize_for_detection(img)
+		
+		detections = []
+		
+		try: 
+			with lock:
+				detections = face_detector.detectMultiScale(detection_img, 1.3, 5)
+		except:
+			pass
+		
+		for x, y, w, h in detections:
+			faces.append({"box": (int(x), int(y), int(w), int(h)), "confidence": None, "landmarks": None})
+		
+		faces = scale_faces(faces, scale)
+	
+	elif detector_backend == 'ssd':
+		
+		#ssd always runs on a 300x300 copy. max_detection_side does not apply.
+		
+		ssd_detector, lock = get_detector('ssd')
+		
+		target_size = (300, 300)
 		
 		original_size = img.shape
 		
-		img = cv2.resize(img, target_size)
+		resized_img = cv2.resize(img, target_size)
 		
 		aspect_ratio_x = (original_size[1] / target_size[1])
 		aspect_ratio_y = (original_size[0] / target_size[0])
 		
-		imageBlob = cv2.dnn.blobFromImage(image = img)
+		imageBlob = cv2.dnn.blobFromImage(image = resized_img)
 		
-		ssd_detector.setInput(imageBlob)
-		detections = ssd_detector.forward()
+		with lock:
+			ssd_detector.setInput(imageBlob)
+			detections = ssd_detector.forward()
+		
+		faces = find_ssd_faces(detections[0][0], aspect_ratio_x, aspect_ratio_y)
+	
+	elif detector_backend == 'dlib':
 		
-		detections_df = pd.DataFrame(detections[0][0], columns = ssd_labels)
+		detector, lock = get_detector('dlib')
 		
-		detections_df = detections_df[detections_df['is_face'] == 1] #0: background, 1: face
-		detections_df = detections_df[detections_df['confidence'] >= 0.90]
+		detection_img, scale = resize_for_detection(img)
 		
-		detections_df['left'] = (detections_df['left'] * 300).astype(int)
-		detections_df['bottom'] = (detections_df['bottom'] * 300).astype(int)
-		detections_df['right'] = (detections_df['right'] * 300).astype(int)
-		detections_df['top'] = (detections_df['top'] * 300).astype(int)
+		with lock:
+			detections, scores, idx = detector.run(detection_img, 1)
 		
-		if detections_df.shape[0] > 0:
-			
-			#TODO: sort detections_df
-			
-			#get the first face in the image	
-			instance = detections_df.iloc[0]
-			
-			left = instance["left"]
-			right = instance["right"]
-			bottom = instance["bottom"]
-			top = instance["top"]
-			
-			detected_face = base_img[int(top*aspect_ratio_y):int(bottom*aspect_ratio_y), int(left*aspect_ratio_x):int(right*aspect_ratio_x)]
+		for i in range(0, len(detections)):
+			d = detections[i]
 			
-			return detected_face
+			left = int(round(d.left() / scale)); right = int(round(d.right() / scale))
+			top = int(round(d.top() / scale)); bottom = int(round(d.bottom() / scale))
 			
-		else: #if no face detected
+			#shape predictor runs later in find_landmarks, just for the faces to be aligned
+			faces.append({"box": (left, top, right - left, bottom - top), "confidence": float(scores[i]), "landmarks": None})
 	
-			if enforce_detection != True:
-				img = base_img.copy()
-				return img
+	elif detector_backend == 'mtcnn':
+		
+		mtcnn_detector, lock = get_detector('mtcnn')
+		
+		detection_img, scale = resize_for_detection(img)
+		
+		with lock:
+			detections = mtcnn_detector.detect_faces(detection_img)
+		
+		faces = scale_faces(find_mtcnn_faces(detections), scale)
 	
-			else:
-				raise ValueError("Face could not be detected. Please confirm that the picture is a face photo or consider to set enforce_detection param to False.")
+	else:
+		detectors = ['opencv', 'ssd', 'dlib', 'mtcnn']
+		raise ValueError("Valid backends are ", detectors," but you passed ", detector_backend)
 	
-	elif detector_backend == 'dlib':
-		import dlib #this is not a must library within deepface. that's why, I didn't put this import to a global level. version: 19.20.0
+	return faces
+
+def find_ssd_faces(detections, aspect_ratio_x, aspect_ratio_y):
+	
+	#detections of a single image in shape of (number of detections, 7). boxes are mapped back to the original resolution.
+	#columns are img_id, is_face, confidence, left, top, right and bottom. faces are returned in descending order of confidence.
+	
+	detections = detections[(detections[:, 1] == 1) & (detections[:, 2] >= 0.90)] #is_face 0: background, 1: face
+	
+	detections = detections[np.argsort(-detections[:, 2], kind = 'stable')]
+	
+	boxes = (detections[:, 3:7] * 300).astype(int)
+	
+	faces = []
+	
+	for i in range(0, detections.shape[0]):
+		left = int(boxes[i][0]*aspect_ratio_x); right = int(boxes[i][2]*aspect_ratio_x)
+		top = int(boxes[i][1]*aspect_ratio_y); bottom = int(boxes[i][3]*aspect_ratio_y)
 		
-		detector = dlib.get_frontal_face_detector()
+		faces.append({"box": (left, top, right - left, bottom - top), "confidence": float(detections[i][2]), "landmarks": None})
+	
+	return faces
+
+def find_mtcnn_faces(detections):
+	
+	faces = []
+	
+	for detection in detections:
+		x, y, w, h = detection["box"]
 		
-		detections = detector(img, 1)
+		landmarks = dict((key, (int(point[0]), int(point[1]))) for key, point in detection["keypoints"].items())
 		
-		if len(detections) > 0:
+		faces.append({"box": (int(x), int(y), int(w), int(h)), "confidence": float(detection["confidence"]), "landmarks": landmarks})
+	
+	return faces
+
+#------------------------------
+#bulk jobs decode and detect images in chunks. a chunk is bounded both in number of images and in memory of decoded images.
+
+batch_detectors = ['ssd', 'mtcnn'] #detectors processing a chunk in batches. others process images one by one anyway.
+detection_batch_size = 8
+detection_batch_memory = 256 #MB
+
+def find_faces_chunks(imgs, detector_backend = 'opencv', use_cache = True):
+	
+	#yields (img, faces, cache key, decode scale) for each image in order. ssd and mtcnn images are loaded and detected in chunks, others one by one.
+	#images in the face cache are yielded as they are with faces None. they are not loaded and detected at all.
+	
+	batch_size = detection_batch_size if detector_backend in batch_detectors else 1
+	
+	i = 0
+	
+	while i < len(imgs):
+		chunk = []; chunk_memory = 0
+		
+		while i < len(imgs) and len(chunk) < batch_size and chunk_memory < detection_batch_memory:
+			key = find_cache_key(imgs[i], detector_backend) if use_cache == True else None
 			
-			for idx, d in enumerate(detections):
-				left = d.left(); right = d.right()
-				top = d.top(); bottom = d.bottom()
-				
-				detected_face = img[top:bottom, left:right]
-				
-				return detected_face
+			if face_cache.contains(key):
+				chunk.append([imgs[i], None, key, None])
+			else:
+				img, scale = load_image(imgs[i], return_scale = True)
+				chunk.append([img, [], key, scale])
+				chunk_memory = chunk_memory + img.nbytes / (1024 * 1024)
 			
-		else: #if no face detected
+			i = i + 1
+		
+		loaded = [item for item in chunk if item[1] is not None]
+		
+		for item, image_faces in zip(loaded, find_faces_batch([item[0] for item in loaded], detector_backend = detector_backend)):
+			item[1] = image_faces
+		
+		for item in chunk:
+			yield tuple(item)
+
+def find_faces_batch(imgs, detector_backend = 'opencv'):
 	
-			if enforce_detection != True:			
-				return img
+	#find_faces for a list of images. ssd detects faces of all images in a single forward pass.
+	#mtcnn runs its refinement networks once for candidates of all images. other detectors process images one by one.
 	
-			else:
-				raise ValueError("Face could not be detected. Please confirm that the picture is a face photo or consider to set enforce_detection param to False.") 
+	if detector_backend not in ['ssd', 'mtcnn'] or len(imgs) <= 1:
+		return [find_faces(img, detector_backend = detector_backend) for img in imgs]
+	
+	if detector_backend == 'mtcnn':
+		mtcnn_detector, lock = get_detector('mtcnn')
 		
-	elif detector_backend == 'mtcnn':
+		detection_imgs, scales = zip(*[resize_for_detection(img) for img in imgs])
 		
-		mtcnn_detector = MTCNN()
+		with lock:
+			detections = mtcnn_batch.detect_faces(mtcnn_detector, list(detection_imgs))
 		
-		detections = mtcnn_detector.detect_faces(img)
+		return [scale_faces(find_mtcnn_faces(detections[i]), scales[i]) for i in range(0, len(imgs))]
+	
+	ssd_detector, lock = get_detector('ssd')
+	
+	target_size = (300, 300)
+	
+	imageBlob = cv2.dnn.blobFromImages(images = [cv2.resize(img, target_size) for img in imgs])
+	
+	with lock:
+		ssd_detector.setInput(imageBlob)
+		detections = ssd_detector.forward()
+	
+	detections = detections[0][0]
+	
+	faces = []
+	
+	for i in range(0, len(imgs)):
+		aspect_ratio_x = (imgs[i].shape[1] / target_size[1])
+		aspect_ratio_y = (imgs[i].shape[0] / target_size[0])
 		
-		if len(detections) > 0:
-			detection = detections[0]
-			x, y, w, h = detection["box"]
-			detected_face = img[int(y):int(y+h), int(x):int(x+w)]
-			return detected_face
+		#first column is the index of the image in the batch
+		faces.append(find_ssd_faces(detections[detections[:, 0] == i], aspect_ratio_x, aspect_ratio_y))
+	
+	return faces
+
+def find_landmarks(img, face, detector_backend = 'opencv'):
+	
+	#dlib landmarks are found for the faces really aligned. single face paths use just the first face of a group photo.
+	#found landmarks are stored in the face. faces shared by several calls run the shape predictor once.
+	
+	if detector_backend == 'dlib' and face["landmarks"] is None:
 		
-		else: #if no face detected
-			if enforce_detection != True:			
-				return img
+		import dlib #this is not a must dependency in deepface
+		
+		sp, sp_lock = get_detector('dlib_shape_predictor')
+		
+		x, y, w, h = face["box"]
+		
+		#landmarks are found in the full resolution image. align_face reuses them instead of detecting the face again.
+		with sp_lock:
+			img_shape = sp(img, dlib.rectangle(x, y, x + w, y + h))
+		
+		face["landmarks"] = [(img_shape.part(j).x, img_shape.part(j).y) for j in range(0, img_shape.num_parts)]
 	
-			else:
-				raise ValueError("Face could not be detected. Please confirm that the picture is a face photo or consider to set enforce_detection param to False.")
+	return face["landmarks"]
+
+def shift_landmarks(landmarks, x, y):
+	
+	#moves landmarks into the coordinates of a face cropped at (x, y)
+	
+	if landmarks is None:
+		return None
+	
+	if type(landmarks) == dict:
+		return dict((key, (point[0] - x, point[1] - y)) for key, point in landmarks.items())
+	
+	return [(point[0] - x, point[1] - y) for point in landmarks]
+
+def detect_face_landmarks(img, detector_backend = 'opencv', grayscale = False, enforce_detection = True, faces = None):
 	
+	#returns the first detected face and its landmarks in the coordinates of the detected face.
+	#landmarks are None for opencv and ssd, or if no face is detected.
+	#faces might be found beforehand, e.g. by find_faces_batch. otherwise, the detector runs here.
+	
+	if faces is None:
+		faces = find_faces(img, detector_backend = detector_backend)
+	
+	if len(faces) > 0:
+		x, y, w, h = faces[0]["box"] #focus on the 1st face found in the image
+		detected_face = img[int(y):int(y+h), int(x):int(x+w)]
+		return detected_face, shift_landmarks(find_landmarks(img, faces[0], detector_backend = detector_backend), x, y)
+	
+	else: #if no face detected
+		
+		if enforce_detection != True:
+			return img, None
+		
+		else:
+			raise ValueError("Face could not be detected. Please confirm that the picture is a face photo or consider to set enforce_detection param to False.")
+
+def detect_faces(img, detector_backend = 'opencv', align = True, faces = None, decode_scale = None):
+	
+	#img might be path, base64 or numpy array. returns every face in a single detector pass.
+	#each item has box, confidence, landmarks and the face itself in bgr. faces are aligned if align is True.
+	#faces might be found beforehand, e.g. by find_faces_batch.
+	#boxes and landmarks are in the coordinates of the original image. decode_scale is the scale of img if it is already loaded in reduced resolution.
+	
+	if decode_scale is None:
+		img, decode_scale = load_image(img, return_scale = True)
 	else:
-		detectors = ['opencv', 'ssd', 'dlib', 'mtcnn']
-		raise ValueError("Valid backends are ", detectors," but you passed ", detector_backend)
+		img = load_image(img)
+	
+	if faces is None:
+		faces = find_faces(img, detector_backend = detector_backend)
 	
-	return 0
+	resp = []
+	
+	for face in faces:
+		x, y, w, h = face["box"]
+		
+		find_landmarks(img, face, detector_backend = detector_backend)
+		
+		detected_face = img[max(0, y):y+h, max(0, x):x+w]
+		
+		if align == True and detected_face.shape[0] > 0 and detected_face.shape[1] > 0:
+			detected_face = align_face(img = detected_face, detector_backend = detector_backend, landmarks = shift_landmarks(face["landmarks"], max(0, x), max(0, y)))
+		
+		item = face.copy()
+		item["face"] = detected_face
+		resp.append(item)
+	
+	return scale_faces(resp, decode_scale)
 
 def alignment_procedure(img, left_eye, right_eye):
 		
@@ -347,93 +710,147 @@ def alignment_procedure(img, left_eye, right_eye):
 	
 	return img #return img anyway
 	
-def align_face(img, detector_backend = 'opencv'):
+def find_eyes(img, detector_backend = 'opencv', landmarks = None):
 	
-	home = str(Path.home())
-	
-	if (detector_backend == 'opencv') or (detector_backend == 'ssd'):
+	#returns centers of the left and right eye in img or None if they cannot be found.
+	#opencv and ssd find eyes with the eye cascade. mtcnn and dlib use the landmarks of the detected face.
 	
-		opencv_path = get_opencv_path()
-		eye_detector_path = opencv_path+"haarcascade_eye.xml"
-		eye_detector = cv2.CascadeClassifier(eye_detector_path)
+	if detector_backend in ['mtcnn', 'dlib']:
+		
+		if landmarks is None:
+			return None
+		
+		if detector_backend == 'mtcnn':
+			return landmarks["left_eye"], landmarks["right_eye"]
 		
-		detected_face_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) #eye detector expects gray scale image
+		#5 point shape predictor stores two corners of each eye and the nose
+		eye_1 = ((landmarks[0][0] + landmarks[1][0]) / 2, (landmarks[0][1] + landmarks[1][1]) / 2)
+		eye_2 = ((landmarks[2][0] + landmarks[3][0]) / 2, (landmarks[2][1] + landmarks[3][1]) / 2)
 		
+		if eye_1[0] < eye_2[0]:
+			return eye_1, eye_2
+		
+		return eye_2, eye_1
+	
+	eye_detector, lock = get_detector('eye')
+	
+	detected_face_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) #eye detector expects gray scale image
+	
+	with lock:
 		eyes = eye_detector.detectMultiScale(detected_face_gray)
+	
+	if len(eyes) < 2:
+		return None
+	
+	#find the largest 2 eye
+	
+	eyes = eyes[np.argsort(-eyes[:, 2], kind = 'stable')[0:2]] #eyes variable stores the largest 2 eye
+	
+	#-----------------------
+	#decide left and right eye
+	
+	eye_1 = eyes[0]; eye_2 = eyes[1]
+	
+	if eye_1[0] < eye_2[0]:
+		left_eye = eye_1; right_eye = eye_2
+	else:
+		left_eye = eye_2; right_eye = eye_1
+	
+	#-----------------------
+	#find center of eyes
+	
+	left_eye = (int(left_eye[0] + (left_eye[2] / 2)), int(left_eye[1] + (left_eye[3] / 2)))
+	right_eye = (int(right_eye[0] + (right_eye[2]/2)), int(right_eye[1] + (right_eye[3]/2)))
+	
+	return left_eye, right_eye
+
+def warp_face(img, eyes, target_size = (224, 224)):
+	
+	#rotates img around its center to make the eyes horizontal and resizes it to target_size in a single warpAffine call.
+	#this is the transform of alignment_procedure and the following resize, composed into one matrix.
+	
+	h, w = img.shape[0:2]
+	
+	angle = 0
+	if eyes is not None:
+		left_eye, right_eye = eyes
+		angle = math.degrees(math.atan2(right_eye[1] - left_eye[1], right_eye[0] - left_eye[0]))
+	
+	rotation = np.vstack([cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0), [0, 0, 1]])
+	scale = np.array([[target_size[0] / w, 0, 0], [0, target_size[1] / h, 0], [0, 0, 1]])
+	
+	transform = scale.dot(rotation)[0:2]
+	
+	return cv2.warpAffine(img, transform, tuple(target_size), flags = cv2.INTER_LINEAR, borderMode = cv2.BORDER_CONSTANT, borderValue = 0)
+
+#------------------------------
+#alignment modes. rotate aligns faces with alignment_procedure, dlib face chips or a second mtcnn pass and resizes them afterwards.
+#affine crops, rotates and resizes each face in a single warp from the landmarks of the detected face.
+
+alignment_modes = ['rotate', 'affine']
+alignment_mode = 'rotate'
+
+def set_alignment_mode(mode):
+	
+	global alignment_mode
+	
+	if mode not in alignment_modes:
+		raise ValueError("Valid alignment modes are ", alignment_modes," but you passed ", mode)
+	
+	alignment_mode = mode
+
+def align_face(img, detector_backend = 'opencv', landmarks = None):
+	
+	#landmarks found by find_faces, moved into the coordinates of img, skip detecting the face again for mtcnn and dlib
+	
+	if (detector_backend == 'opencv') or (detector_backend == 'ssd'):
 		
-		if len(eyes) >= 2:
-			
-			#find the largest 2 eye
-			
-			base_eyes = eyes[:, 2]
-			
-			items = []
-			for i in range(0, len(base_eyes)):
-				item = (base_eyes[i], i)
-				items.append(item)
-			
-			df = pd.DataFrame(items, columns = ["length", "idx"]).sort_values(by=['length'], ascending=False)
-			
-			eyes = eyes[df.idx.values[0:2]] #eyes variable stores the largest 2 eye
-			
-			#-----------------------
-			#decide left and right eye
-			
-			eye_1 = eyes[0]; eye_2 = eyes[1]
-			
-			if eye_1[0] < eye_2[0]:
-				left_eye = eye_1; right_eye = eye_2
-			else:
-				left_eye = eye_2; right_eye = eye_1
-			
-			#-----------------------
-			#find center of eyes
-			
-			left_eye = (int(left_eye[0] + (left_eye[2] / 2)), int(left_eye[1] + (left_eye[3] / 2)))
-			right_eye = (int(right_eye[0] + (right_eye[2]/2)), int(right_eye[1] + (right_eye[3]/2)))
-			
-			img = alignment_procedure(img, left_eye, right_eye)
+		eyes = find_eyes(img)
+		
+		if eyes is not None:
+			img = alignment_procedure(img, eyes[0], eyes[1])
 			
 		return img #return img anyway
 	
 	elif detector_backend == 'dlib':
-	
-		#check required file exists in the home/.deepface/weights folder
-		
-		if os.path.isfile(home+'/.deepface/weights/shape_predictor_5_face_landmarks.dat') != True:
-			
-			print("shape_predictor_5_face_landmarks.dat.bz2 is going to be downloaded") 
-			
-			url = "http://dlib.net/files/shape_predictor_5_face_landmarks.dat.bz2"
-			output = home+'/.deepface/weights/'+url.split("/")[-1]
-			
-			gdown.download(url, output, quiet=False)
-			
-			zipfile = bz2.BZ2File(output)
-			data = zipfile.read()
-			newfilepath = output[:-4] #discard .bz2 extension
-			open(newfilepath, 'wb').write(data)
-		
-		#------------------------------
 		
 		import dlib #this is not a must dependency in deepface
 		
-		detector = dlib.get_frontal_face_detector()
-		sp = dlib.shape_predictor(home+"/.deepface/weights/shape_predictor_5_face_landmarks.dat")
+		if landmarks is not None:
+			points = dlib.points()
+			for point in landmarks:
+				points.append(dlib.point(int(point[0]), int(point[1])))
+			
+			img_shape = dlib.full_object_detection(dlib.rectangle(0, 0, img.shape[1], img.shape[0]), points)
+			img = dlib.get_face_chip(img, img_shape, size = img.shape[0])
+			return img
+		
+		detector, lock = get_detector('dlib')
+		sp, sp_lock = get_detector('dlib_shape_predictor')
 		
-		detections = detector(img, 1)
+		with lock:
+			detections = detector(img, 1)
 		
 		if len(detections) > 0:
 			detected_face = detections[0]
-			img_shape = sp(img, detected_face)
+			
+			with sp_lock:
+				img_shape = sp(img, detected_face)
+			
 			img = dlib.get_face_chip(img, img_shape, size = img.shape[0])
 			
 		return img #return img anyway
 	
 	elif detector_backend == 'mtcnn':
 		
-		mtcnn_detector = MTCNN()
-		detections = mtcnn_detector.detect_faces(img)
+		if landmarks is not None:
+			img = alignment_procedure(img, landmarks["left_eye"], landmarks["right_eye"])
+			return img
+		
+		mtcnn_detector, lock = get_detector('mtcnn')
+		
+		with lock:
+			detections = mtcnn_detector.detect_faces(img)
 		
 		if len(detections) > 0:
 			detection = detections[0]
@@ -446,39 +863,237 @@ def align_face(img, detector_backend = 'opencv'):
 				
 		return img #return img anyway
 	
-def preprocess_face(img, target_size=(224, 224), grayscale = False, enforce_detection = True, detector_backend = 'opencv'):
+def preprocess_face(img, target_size=(224, 224), grayscale = False, enforce_detection = True, detector_backend = 'opencv', rgb_uint8 = False, faces = None, cache_key = None):
+	
+	#rgb_uint8 returns raw rgb pixels in uint8 for models expecting them such as dlib. keras models expect bgr pixels in scale of [0, 1].
+	#cache_key is the face cache key of the original input if img is already loaded from it, e.g. by find_faces_chunks.
+	
+	if cache_key is None:
+		cache_key = find_cache_key(img, detector_backend)
+	
+	img = find_aligned_face(img, target_size = target_size, enforce_detection = enforce_detection, detector_backend = detector_backend, faces = faces, key = cache_key)
+	
+	return postprocess_face(img, target_size = target_size, grayscale = grayscale, rgb_uint8 = rgb_uint8)
+
+def find_cache_key(img, detector_backend = 'opencv'):
+	
+	#returns None if the face cache is disabled. settings changing the detected or aligned face are a part of the key.
+	
+	if face_cache.enabled() != True:
+		return None
+	
+	return face_cache.find_key(img, [detector_backend, alignment_mode, max_detection_side, min_decode_side])
+
+def find_aligned_face(img, target_size = (224, 224), enforce_detection = True, detector_backend = 'opencv', faces = None, key = None):
+	
+	#returns the first face in img aligned but not resized yet. affine mode warps it into target_size directly.
+	#detected faces are stored in the face cache with key. faces found in a cached image are not detected and aligned again.
+	
+	entry = face_cache.get(key)
+	
+	if entry is not None:
+		if alignment_mode == 'affine':
+			return warp_face(entry["face"], entry["eyes"], target_size = target_size)
+		
+		return entry["face"]
+	
+	#--------------------------
 	
 	#img might be path, base64 or numpy array. Convert it to numpy whatever it is.
 	img = load_image(img)
-	base_img = img.copy()
+	base_img = img #steps below do not modify img in place
+	
+	if faces is None:
+		faces = find_faces(img, detector_backend = detector_backend)
 	
-	img = detect_face(img = img, detector_backend = detector_backend, grayscale = grayscale, enforce_detection = enforce_detection)
+	img, landmarks = detect_face_landmarks(img = img, detector_backend = detector_backend, enforce_detection = enforce_detection, faces = faces)
 	
 	#--------------------------
 	
 	if img.shape[0] > 0 and img.shape[1] > 0:
-		img = align_face(img = img, detector_backend = detector_backend)
+		if alignment_mode == 'affine': #detected face is a view of the original image. it is not copied before the warp.
+			eyes = find_eyes(img, detector_backend = detector_backend, landmarks = landmarks)
+			
+			if key is not None and len(faces) > 0:
+				face_cache.put(key, faces[0]["box"], eyes, img.copy())
+			
+			img = warp_face(img, eyes, target_size = target_size)
+		else:
+			img = align_face(img = img, detector_backend = detector_backend, landmarks = landmarks)
+			
+			if key is not None and len(faces) > 0:
+				img = img.copy() #aligned face might still be a view of the original image
+				face_cache.put(key, faces[0]["box"], None, img)
 	else:
 		
 		if enforce_detection == True:
 			raise ValueError("Detected face shape is ", img.shape,". Consider to set enforce_detection argument to False.")
 		else: #restore base image 
-			img = base_img.copy()
-		
-	#--------------------------
+			img = base_img
+	
+	return img
+
+def postprocess_face(img, target_size=(224, 224), grayscale = False, rgb_uint8 = False):
+	
+	#converts a detected and aligned face into the input of a model in shape of (1, target_size, channels)
 	
-	#post-processing
 	if grayscale == True:
 		img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-		
-	img = cv2.resize(img, target_size)
+	
+	if img.shape[0] != target_size[1] or img.shape[1] != target_size[0]: #warped faces are already in target size
+		img = cv2.resize(img, target_size)
+	
+	if rgb_uint8 == True:
+		img = cv2.cvtColor(img.astype(np.uint8, copy = False), cv2.COLOR_BGR2RGB)
+		return np.expand_dims(img, axis = 0)
+	
 	img_pixels = image.img_to_array(img)
 	img_pixels = np.expand_dims(img_pixels, axis = 0)
 	img_pixels /= 255 #normalize input in [0, 1]
 	
 	return img_pixels
+
+def preprocess_face_batch(imgs, target_size=(224, 224), grayscale = False, enforce_detection = True, detector_backend = 'opencv', rgb_uint8 = False):
+	
+	#preprocess_face for a list of images. the first face of each image is returned in a single array.
+	#ssd and mtcnn detect faces in small chunks. images in the face cache are not loaded and detected again.
+	
+	img_pixels = []
+	
+	for img, faces, key, scale in find_faces_chunks(imgs, detector_backend = detector_backend):
+		img = find_aligned_face(img, target_size = target_size, enforce_detection = enforce_detection, detector_backend = detector_backend, faces = faces, key = key)
+		img_pixels.append(postprocess_face(img, target_size = target_size, grayscale = grayscale, rgb_uint8 = rgb_uint8))
+	
+	return np.concatenate(img_pixels, axis = 0)
+
+def preprocess_faces(img, target_size=(224, 224), grayscale = False, enforce_detection = True, detector_backend = 'opencv', rgb_uint8 = False, faces = None, decode_scale = None):
+	
+	#multi-face version of preprocess_face. returns a batch of all faces in img and the detected faces.
+	#whole image is returned as a single face if no face is detected and enforce_detection is False.
+	#boxes of the returned faces are in the coordinates of the original image. decode_scale is the scale of img if it is already loaded in reduced resolution.
+	
+	if decode_scale is None:
+		img, decode_scale = load_image(img, return_scale = True)
+	else:
+		img = load_image(img)
+	
+	#faces are processed in the coordinates of the loaded image and mapped back at the end
+	faces = [face for face in detect_faces(img, detector_backend = detector_backend, align = alignment_mode != 'affine', faces = faces, decode_scale = 1) if face["face"].shape[0] > 0 and face["face"].shape[1] > 0]
+	
+	if alignment_mode == 'affine':
+		for face in faces:
+			x, y, w, h = face["box"]
+			landmarks = shift_landmarks(face["landmarks"], max(0, x), max(0, y))
+			face["face"] = warp_face(face["face"], find_eyes(face["face"], detector_backend = detector_backend, landmarks = landmarks), target_size = target_size)
+	
+	if len(faces) == 0:
+		if enforce_detection == True:
+			raise ValueError("Face could not be detected. Please confirm that the picture is a face photo or consider to set enforce_detection param to False.")
+		
+		faces = [{"box": (0, 0, img.shape[1], img.shape[0]), "confidence": None, "landmarks": None, "face": img}]
+	
+	img_pixels = np.concatenate([postprocess_face(face["face"], target_size = target_size, grayscale = grayscale, rgb_uint8 = rgb_uint8) for face in faces], axis = 0)
+	
+	return img_pixels, scale_faces(faces, decode_scale)
+	
+#------------------------------
+#cpu resource planning. several workers on the same box share its cores instead of each one claiming all of them.
+
+cpu_plan = None #plan applied to this process
+
+def find_cpu_count():
+	
+	#cores available to this process. affinity masks and cgroup quotas of containers are respected.
+	
+	if hasattr(os, 'sched_getaffinity'):
+		cpu_count = len(os.sched_getaffinity(0))
+	else:
+		cpu_count = os.cpu_count() or 1
+	
+	quota = None
+	
+	try:
+		if os.path.isfile("/sys/fs/cgroup/cpu.max"): #cgroup v2
+			with open("/sys/fs/cgroup/cpu.max", "r") as f:
+				items = f.read().split()
+			
+			if items[0] != "max":
+				quota = int(items[0]) / int(items[1])
+		
+		elif os.path.isfile("/sys/fs/cgroup/cpu/cpu.cfs_quota_us"): #cgroup v1
+			with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "r") as f:
+				cfs_quota = int(f.read())
+			with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us", "r") as f:
+				cfs_period = int(f.read())
+			
+			if cfs_quota > 0:
+				quota = cfs_quota / cfs_period
+	except:
+		pass
+	
+	if quota is not None:
+		cpu_count = min(cpu_count, max(1, int(math.ceil(quota))))
+	
+	return cpu_count
+
+def find_thread_count():
+	#threads deepface's own pools might use in this process
+	if cpu_plan is not None:
+		return cpu_plan["threads_per_worker"]
+	
+	return find_cpu_count()
+
+def plan_cpu_resources(workers = 1):
+	
+	#workers is the number of deepface processes sharing this box, e.g. gunicorn workers.
+	#tf sessions created before the plan keep their thread pools. call this before building models.
+	
+	global cpu_plan
+	
+	from . import registry
+	
+	cpu_count = find_cpu_count()
+	
+	threads_per_worker = max(1, cpu_count // max(1, workers))
+	inter_op_threads = min(2, threads_per_worker)
+	
+	plan = {}
+	plan["cpu_count"] = cpu_count
+	plan["workers"] = workers
+	plan["threads_per_worker"] = threads_per_worker
+	plan["intra_op_threads"] = threads_per_worker
+	plan["inter_op_threads"] = inter_op_threads
+	
+	if cpu_plan == plan: #already applied
+		return plan
+	
+	if hasattr(tf, 'ConfigProto'): #tf 1.x
+		
+		#models and mtcnn detectors are bound to the current session. they could not run in a new one.
+		if len(registry.resident()) > 0 or 'mtcnn' in detector_obj:
+			raise ValueError("CPU resources must be planned before models are built. Resident models: ", list(registry.resident().keys()),". Call registry.reset() first.")
+		
+		config = tf.ConfigProto(intra_op_parallelism_threads = threads_per_worker, inter_op_parallelism_threads = inter_op_threads)
+		session = tf.Session(config = config)
+		keras.backend.set_session(session)
+	else: #tf 2.x
+		try:
+			tf.config.threading.set_intra_op_parallelism_threads(threads_per_worker)
+			tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+		except RuntimeError: #tf runtime is already initialized
+			print("WARNING: tf threads cannot be changed after the runtime is initialized. Call plan_cpu_resources before building models.")
+	
+	cv2.setNumThreads(threads_per_worker)
+	
+	cpu_plan = plan
+	
+	print("DeepFace will run on ", threads_per_worker," of ", cpu_count," cores in each of ", workers," workers")
+	
+	return plan
+
+def allocateMemory(workers = None):
 	
-def allocateMemory():
+	#cpu resources are planned only if workers is passed
 	
 	#find allocated memories
 	gpu_indexes = []
@@ -561,5 +1176,9 @@ def allocateMemory():
 			os.environ["CUDA_VISIBLE_DEVICES"] = "" #run it on cpu
 			print("Even though the system has GPUs, there is no enough space in memory to allocate.")
 			print("DeepFace will run on CPU")
+			if workers is not None:
+				plan_cpu_resources(workers)
 	else:
 		print("DeepFace will run on CPU")
+		if workers is not None:
+			plan_cpu_resources(workers)
@@ -0,0 +1,201 @@
+import numpy as np
+import cv2
+from mtcnn.mtcnn import StageStatus #0.1.0
+
+#---------------------------------------
+#mtcnn detects faces of a single image. p-net runs on the scale pyramid of each image because pyramids differ in size.
+#candidates of all images are stacked afterwards. r-net and o-net run once for the whole list instead of once for each image.
+#private helpers of the mtcnn package are reused to find the same boxes with its detect_faces function.
+
+def crop_candidates(img, total_boxes, status, size):
+
+	#returns candidate boxes resized to size x size or None if mtcnn would drop the image
+
+	crops = []
+
+	for k in range(0, total_boxes.shape[0]):
+		tmp = np.zeros((int(status.tmph[k]), int(status.tmpw[k]), 3))
+		tmp[status.dy[k] - 1:status.edy[k], status.dx[k] - 1:status.edx[k], :] = img[status.y[k] - 1:status.ey[k], status.x[k] - 1:status.ex[k], :]
+
+		if tmp.shape[0] > 0 and tmp.shape[1] > 0 or tmp.shape[0] == 0 and tmp.shape[1] == 0:
+			crops.append(cv2.resize(tmp, (size, size), interpolation = cv2.INTER_AREA))
+		else:
+			return None
+
+	return crops
+
+def predict_candidates(network, candidates):
+
+	#candidates is a list of crop lists, one for each image. returns network outputs split back into images.
+
+	counts = [len(crops) for crops in candidates]
+
+	if sum(counts) == 0:
+		return [None for crops in candidates]
+
+	tempimg = np.stack([crop for crops in candidates for crop in crops], axis = 0)
+	tempimg = (tempimg - 127.5) * 0.0078125
+	tempimg = np.transpose(tempimg, (0, 2, 1, 3)) #mtcnn networks expect transposed crops
+
+	out = network.predict(tempimg)
+
+	outputs = []
+
+	start = 0
+	for count in counts:
+		outputs.append([item[start:start + count] for item in out])
+		start = start + count
+
+	return outputs
+
+def stage1(detector, img):
+
+	height, width, _ = img.shape
+	stage_status = StageStatus(width = width, height = height)
+
+	m = 12 / detector._min_face_size
+	min_layer = np.amin([height, width]) * m
+
+	scales = detector._MTCNN__compute_scale_pyramid(m, min_layer)
+
+	return detector._MTCNN__stage1(img, scales, stage_status)
+
+def stage2(detector, imgs, boxes, statuses):
+
+	candidates = []
+
+	for i in range(0, len(imgs)):
+		crops = crop_candidates(imgs[i], boxes[i], statuses[i], 24)
+
+		if crops is None:
+			boxes[i] = np.empty((0, 5))
+			crops = []
+
+		candidates.append(crops)
+
+	outputs = predict_candidates(detector._rnet, candidates)
+
+	for i in range(0, len(imgs)):
+		if len(candidates[i]) == 0:
+			continue
+
+		out0 = np.transpose(outputs[i][0])
+		out1 = np.transpose(outputs[i][1])
+
+		score = out1[1, :]
+		ipass = np.where(score > detector._steps_threshold[1])
+
+		total_boxes = np.hstack([boxes[i][ipass[0], 0:4].copy(), np.expand_dims(score[ipass].copy(), 1)])
+		mv = out0[:, ipass[0]]
+
+		if total_boxes.shape[0] > 0:
+			pick = detector._MTCNN__nms(total_boxes, 0.7, 'Union')
+			total_boxes = total_boxes[pick, :]
+			total_boxes = detector._MTCNN__bbreg(total_boxes.copy(), np.transpose(mv[:, pick]))
+			total_boxes = detector._MTCNN__rerec(total_boxes.copy())
+
+		boxes[i] = total_boxes
+
+	return boxes
+
+def stage3(detector, imgs, boxes):
+
+	candidates = []
+
+	for i in range(0, len(imgs)):
+		crops = []
+
+		if boxes[i].shape[0] > 0:
+			boxes[i] = np.fix(boxes[i]).astype(np.int32)
+
+			height, width, _ = imgs[i].shape
+			status = StageStatus(detector._MTCNN__pad(boxes[i].copy(), width, height), width = width, height = height)
+
+			crops = crop_candidates(imgs[i], boxes[i], status, 48)
+
+			if crops is None:
+				boxes[i] = np.empty((0, 5))
+				crops = []
+
+		candidates.append(crops)
+
+	outputs = predict_candidates(detector._onet, candidates)
+
+	results = []
+
+	for i in range(0, len(imgs)):
+		if len(candidates[i]) == 0:
+			results.append((np.empty((0, 5)), np.empty((10, 0))))
+			continue
+
+		out0 = np.transpose(outputs[i][0])
+		out1 = np.transpose(outputs[i][1])
+		out2 = np.transpose(outputs[i][2])
+
+		score = out2[1, :]
+		points = out1
+
+		ipass = np.where(score > detector._steps_threshold[2])
+		points = points[:, ipass[0]]
+
+		total_boxes = np.hstack([boxes[i][ipass[0], 0:4].copy(), np.expand_dims(score[ipass].copy(), 1)])
+		mv = out0[:, ipass[0]]
+
+		w = total_boxes[:, 2] - total_boxes[:, 0] + 1
+		h = total_boxes[:, 3] - total_boxes[:, 1] + 1
+
+		points[0:5, :] = np.tile(w, (5, 1)) * points[0:5, :] + np.tile(total_boxes[:, 0], (5, 1)) - 1
+		points[5:10, :] = np.tile(h, (5, 1)) * points[5:10, :] + np.tile(total_boxes[:, 1], (5, 1)) - 1
+
+		if total_boxes.shape[0] > 0:
+			total_boxes = detector._MTCNN__bbreg(total_boxes.copy(), np.transpose(mv))
+			pick = detector._MTCNN__nms(total_boxes.copy(), 0.7, 'Min')
+			total_boxes = total_boxes[pick, :]
+			points = points[:, pick]
+
+		results.append((total_boxes, points))
+
+	return results
+
+def detect_faces(detector, imgs):
+
+	#returns detections of each image in the format of MTCNN.detect_faces
+
+	boxes = []; statuses = []
+
+	for img in imgs:
+		total_boxes, status = stage1(detector, img)
+		boxes.append(total_boxes)
+		statuses.append(status)
+
+	boxes = stage2(detector, imgs, boxes, statuses)
+
+	results = stage3(detector, imgs, boxes)
+
+	resp = []
+
+	for total_boxes, points in results:
+		detections = []
+
+		for bounding_box, keypoints in zip(total_boxes, points.T):
+			x = max(0, int(bounding_box[0]))
+			y = max(0, int(bounding_box[1]))
+			width = int(bounding_box[2] - x)
+			height = int(bounding_box[3] - y)
+
+			detection = {}
+			detection["box"] = [x, y, width, height]
+			detection["confidence"] = bounding_box[-1]
+			detection["keypoints"] = {
+				"left_eye": (int(keypoints[0]), int(keypoints[5])),
+				"right_eye": (int(keypoints[1]), int(keypoints[6])),
+				"nose": (int(keypoints[2]), int(keypoints[7])),
+				"mouth_left": (int(keypoints[3]), int(keypoints[8])),
+				"mouth_right": (int(keypoints[4]), int(keypoints[9]))
+			}
+
+			detections.append(detection)
+
+		resp.append(detections)
+
+	return resp
@@ -0,0 +1,157 @@
+import os
+import threading
+from pathlib import Path
+import numpy as np
+import cv2
+
+from . import registry
+
+#---------------------------------------
+#opencv dnn execution engine. keras models are frozen into tensorflow graphs once and run by cv2.dnn afterwards.
+#tensorflow is used once to freeze a graph. predictions of a frozen graph are run by opencv only.
+
+models = ['VGG-Face', 'OpenFace', 'Facenet', 'DeepFace', 'DeepID', 'Emotion', 'Age', 'Gender', 'Race']
+
+#input shapes of the models are fixed. frozen graphs can be loaded without building the keras model.
+input_shapes = {
+	'VGG-Face': (None, 224, 224, 3),
+	'OpenFace': (None, 96, 96, 3),
+	'Facenet': (None, 160, 160, 3),
+	'DeepFace': (None, 152, 152, 3),
+	'DeepID': (None, 55, 47, 3),
+	'Emotion': (None, 48, 48, 1),
+	'Age': (None, 224, 224, 3),
+	'Gender': (None, 224, 224, 3),
+	'Race': (None, 224, 224, 3)
+}
+
+class OpenCVModel:
+
+	def __init__(self, model_path, input_shape):
+
+		self.__model_path = model_path
+
+		self.__net = cv2.dnn.readNetFromTensorflow(model_path)
+		self.__net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+		self.__net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+
+		#a net keeps its input and intermediate blobs. calls from concurrent threads must not interleave.
+		self.__lock = threading.Lock()
+
+		#(None, height, width, channels) as keras models
+		self.input_shape = tuple(input_shape)
+
+		return None #classes must return None
+
+	def memory_size(self):
+		return os.path.getsize(self.__model_path) / (1024 * 1024)
+
+	def predict(self, img):
+
+		#keras models expect nhwc inputs whereas cv2.dnn expects nchw blobs
+		blob = np.ascontiguousarray(img.transpose(0, 3, 1, 2), dtype = np.float32)
+
+		with self.__lock:
+			self.__net.setInput(blob)
+			output = self.__net.forward()
+
+		return output.reshape(img.shape[0], -1)
+
+#---------------------------------------
+
+def get_model_path(model_name):
+	home = str(Path.home())
+	file_name = model_name.replace("-", "_").lower()
+	return home+'/.deepface/weights/'+file_name+'_frozen.pb'
+
+def freeze(model):
+
+	#returns a graph def whose variables are replaced with constants. dropout switches are discarded by building the graph in inference mode.
+
+	import tensorflow as tf
+	from keras import backend as K
+	from keras.models import model_from_json
+	from . import weights
+
+	if hasattr(tf, 'get_default_graph'): #tf 1.x
+		from tensorflow.python.framework import graph_util
+
+		model_json = model.to_json()
+		model_weights = model.get_weights()
+
+		base_session = K.get_session()
+
+		graph = tf.Graph()
+		with graph.as_default():
+			session = tf.Session(graph = graph)
+			K.set_session(session)
+
+			try:
+				K.set_learning_phase(0)
+
+				inference_model = model_from_json(model_json, custom_objects = weights.get_custom_objects())
+				inference_model.set_weights(model_weights)
+
+				output_names = [output.op.name for output in inference_model.outputs]
+
+				graph_def = graph_util.convert_variables_to_constants(session, graph.as_graph_def(), output_names)
+				graph_def = graph_util.remove_training_nodes(graph_def)
+			finally:
+				K.set_session(base_session)
+				session.close()
+
+	else: #tf 2.x
+		from tensorflow.python.framework.convert_to_constants import convert_variables_to_constants_v2
+
+		function = tf.function(lambda x: model(x, training = False))
+		concrete_function = function.get_concrete_function(tf.TensorSpec(model.inputs[0].shape, model.inputs[0].dtype))
+
+		graph_def = convert_variables_to_constants_v2(concrete_function).graph.as_graph_def()
+
+	return graph_def
+
+def convert(model, model_name, tolerance = 1e-3):
+
+	#frozen graph is verified against the keras model on a random batch before it is used
+
+	model_path = get_model_path(model_name)
+
+	graph_def = freeze(model)
+
+	with open(model_path+'.tmp', 'wb') as f:
+		f.write(graph_def.SerializeToString())
+
+	input_shape = registry.find_input_tensor_shape(model)
+
+	img = np.random.uniform(0, 1, size = (2,) + tuple(input_shape[1:])).astype(np.float32)
+
+	base_output = model.predict(img)
+	opencv_output = OpenCVModel(model_path+'.tmp', input_shape).predict(img)
+
+	max_difference = np.abs(base_output.reshape(img.shape[0], -1) - opencv_output).max()
+	max_difference = max_difference / max(np.abs(base_output).max(), 1e-7)
+
+	if max_difference > tolerance:
+		os.remove(model_path+'.tmp')
+		raise ValueError("OpenCV DNN outputs of ", model_name," are not consistent with keras. Relative difference is ", max_difference)
+
+	os.replace(model_path+'.tmp', model_path)
+
+	print(model_name," model is frozen into ", model_path,". Relative difference of outputs is ", max_difference)
+
+	return model_path
+
+def build_model(model_name):
+
+	if model_name not in models:
+		raise ValueError("OpenCV DNN engine supports ", models," but you passed ", model_name)
+
+	def loader():
+		model_path = get_model_path(model_name)
+
+		if os.path.isfile(model_path) != True:
+			convert(registry.get(model_name), model_name)
+
+		return OpenCVModel(model_path, input_shapes[model_name])
+
+	return registry.get(model_name+"@opencv", loader = loader)
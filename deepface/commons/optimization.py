@@ -0,0 +1,146 @@
+import numpy as np
+import tensorflow as tf
+from keras import backend as K
+from keras.models import Model
+
+#---------------------------------------
+#inference time graph optimizations for already built keras models
+
+def fold_weights(layer_weights, batchnorm_weights, batchnorm_config):
+
+	kernel = layer_weights[0]
+
+	if len(layer_weights) > 1:
+		bias = layer_weights[1]
+	else:
+		bias = np.zeros(kernel.shape[-1], dtype = kernel.dtype)
+
+	#batch normalization stores gamma, beta, moving mean and moving variance. gamma or beta might be discarded.
+	batchnorm_weights = list(batchnorm_weights)
+
+	gamma = batchnorm_weights.pop(0) if batchnorm_config.get('scale', True) == True else np.ones(kernel.shape[-1], dtype = kernel.dtype)
+	beta = batchnorm_weights.pop(0) if batchnorm_config.get('center', True) == True else np.zeros(kernel.shape[-1], dtype = kernel.dtype)
+	moving_mean = batchnorm_weights.pop(0)
+	moving_variance = batchnorm_weights.pop(0)
+
+	factor = gamma / np.sqrt(moving_variance + batchnorm_config['epsilon'])
+
+	#output channels are in the last axis of both conv and dense kernels
+	folded_kernel = kernel * factor
+	folded_bias = (bias - moving_mean) * factor + beta
+
+	return [folded_kernel.astype(kernel.dtype), folded_bias.astype(kernel.dtype)]
+
+def fold_batchnorm(model, custom_objects = {}, tolerance = 1e-3):
+
+	#merges each batch normalization layer into the conv or dense layer it follows.
+	#folded model is verified against the original one on a random batch.
+
+	config = model.get_config()
+
+	if 'input_layers' not in config:
+		raise ValueError("Batch normalization folding expects a functional model")
+
+	layer_configs = dict((layer_config['name'], layer_config) for layer_config in config['layers'])
+
+	#find consumers of each layer
+	consumers = {}
+	for layer_config in config['layers']:
+		for node in layer_config['inbound_nodes']:
+			for inbound in node:
+				consumers.setdefault(inbound[0], []).append(layer_config['name'])
+
+	#-----------------------------------
+	#find foldable pairs
+
+	folded_layers = {} #batch normalization layer name -> conv or dense layer name
+
+	for layer_config in config['layers']:
+		if layer_config['class_name'] != 'BatchNormalization':
+			continue
+
+		if len(layer_config['inbound_nodes']) != 1 or len(layer_config['inbound_nodes'][0]) != 1:
+			continue
+
+		axis = layer_config['config']['axis']
+		if type(axis) == list:
+			axis = axis[0]
+
+		#normalization must be applied on output channels, the last axis of conv and dense outputs
+		if axis not in [-1, 3]:
+			continue
+
+		parent_name = layer_config['inbound_nodes'][0][0][0]
+		parent_config = layer_configs[parent_name]
+
+		if parent_config['class_name'] not in ['Conv2D', 'Dense']:
+			continue
+
+		if parent_config['config'].get('activation', 'linear') != 'linear':
+			continue
+
+		#conv output must be consumed by the batch normalization layer only
+		if consumers.get(parent_name, []) != [layer_config['name']]:
+			continue
+
+		folded_layers[layer_config['name']] = parent_name
+
+	#-----------------------------------
+	#rewire graph
+
+	for batchnorm_name, parent_name in folded_layers.items():
+		layer_configs[parent_name]['config']['use_bias'] = True
+
+	config['layers'] = [layer_config for layer_config in config['layers'] if layer_config['name'] not in folded_layers]
+
+	for layer_config in config['layers']:
+		for node in layer_config['inbound_nodes']:
+			for inbound in node:
+				if inbound[0] in folded_layers:
+					inbound[0] = folded_layers[inbound[0]]
+
+	for output_layer in config['output_layers']:
+		if output_layer[0] in folded_layers:
+			output_layer[0] = folded_layers[output_layer[0]]
+
+	#lambda layers might refer tf or keras backend in their functions
+	objects = {'tf': tf, 'K': K}
+	objects.update(custom_objects)
+
+	folded_model = Model.from_config(config, custom_objects = objects)
+
+	#-----------------------------------
+	#restore weights
+
+	parents = dict((parent_name, batchnorm_name) for batchnorm_name, parent_name in folded_layers.items())
+
+	for layer in folded_model.layers:
+		if layer.name in parents:
+			batchnorm_name = parents[layer.name]
+			layer_weights = fold_weights(model.get_layer(layer.name).get_weights(), model.get_layer(batchnorm_name).get_weights(), layer_configs[batchnorm_name]['config'])
+			layer.set_weights(layer_weights)
+
+		elif len(layer.get_weights()) > 0:
+			layer.set_weights(model.get_layer(layer.name).get_weights())
+
+	#-----------------------------------
+	#verify numerically
+
+	input_shape = model.layers[0].input_shape
+	if type(input_shape) == list:
+		input_shape = input_shape[0]
+
+	img = np.random.uniform(0, 1, size = (2,) + tuple(input_shape[1:])).astype(np.float32)
+
+	base_output = model.predict(img)
+	folded_output = folded_model.predict(img)
+
+	max_difference = np.abs(base_output - folded_output).max()
+	max_difference = max_difference / max(np.abs(base_output).max(), 1e-7)
+
+	if max_difference > tolerance:
+		raise ValueError("Folded model is not consistent with the original one. Relative difference is ", max_difference)
+
+	print(len(folded_layers)," batch normalization layers are folded. Relative difference of outputs is ", max_difference)
+
+	return folded_model
@@ -0,0 +1,184 @@
+import os
+import threading
+from pathlib import Path
+import numpy as np
+import tensorflow as tf
+from keras import backend as K
+
+from . import registry
+
+#---------------------------------------
+#reduced precision variants of keras based face recognition models for cpu inference.
+#float16 stores weights in half precision. int8 applies post-training dynamic range quantization to the weights.
+
+precisions = ['float32', 'float16', 'int8']
+
+class TFLiteModel:
+
+	def __init__(self, model_path):
+
+		self.__model_path = model_path
+
+		interpreter = tf.lite.Interpreter(model_path = model_path)
+		interpreter.allocate_tensors()
+
+		self.__interpreter = interpreter
+		self.__input_details = interpreter.get_input_details()[0]
+		self.__output_details = interpreter.get_output_details()[0]
+
+		#interpreters are not thread safe
+		self.__lock = threading.Lock()
+
+		#(1, height, width, channels) as keras models
+		self.input_shape = tuple(self.__input_details['shape'])
+
+		return None #classes must return None
+
+	def memory_size(self):
+		return os.path.getsize(self.__model_path) / (1024 * 1024)
+
+	def predict(self, img):
+
+		representations = []
+
+		with self.__lock:
+			for i in range(0, img.shape[0]):
+				self.__interpreter.set_tensor(self.__input_details['index'], img[i:i+1].astype(np.float32))
+				self.__interpreter.invoke()
+				representations.append(self.__interpreter.get_tensor(self.__output_details['index']).copy())
+
+		return np.concatenate(representations, axis = 0)
+
+#---------------------------------------
+
+def get_model_path(model_name, precision):
+	home = str(Path.home())
+	file_name = model_name.replace("-", "_").lower()
+	return home+'/.deepface/weights/'+file_name+'_'+precision+'.tflite'
+
+def run_converter(converter, precision):
+
+	converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+	if precision == 'float16':
+		converter.target_spec.supported_types = [tf.float16]
+
+	return converter.convert()
+
+def convert(model, model_name, precision):
+
+	if precision not in ['float16', 'int8']:
+		raise ValueError("Valid precisions to convert are float16 and int8 but you passed ", precision)
+
+	if hasattr(tf.lite.TFLiteConverter, 'from_keras_model'): #tf 2.x
+		converter = tf.lite.TFLiteConverter.from_keras_model(model)
+		tflite_model = run_converter(converter, precision)
+
+	else: #tf 1.x
+		from keras.models import model_from_json
+		from . import weights
+
+		#live graph keeps the learning phase switch of dropout layers. model is built again in inference mode in a fresh graph.
+
+		model_json = model.to_json()
+		model_weights = model.get_weights()
+
+		base_session = K.get_session()
+
+		graph = tf.Graph()
+		with graph.as_default():
+			session = tf.Session(graph = graph)
+			K.set_session(session)
+
+			try:
+				K.set_learning_phase(0)
+
+				inference_model = model_from_json(model_json, custom_objects = weights.get_custom_objects())
+				inference_model.set_weights(model_weights)
+
+				converter = tf.lite.TFLiteConverter.from_session(session, inference_model.inputs, inference_model.outputs)
+				tflite_model = run_converter(converter, precision)
+			finally:
+				K.set_session(base_session)
+				session.close()
+
+	model_path = get_model_path(model_name, precision)
+
+	#write into a temporary file first. other workers might load the model at the same time.
+	with open(model_path+'.tmp', 'wb') as f:
+		f.write(tflite_model)
+
+	os.replace(model_path+'.tmp', model_path)
+
+	print(model_name," model is converted to ", precision," precision and stored in ", model_path)
+
+	return model_path
+
+def build_model(model_name, precision = 'float32'):
+
+	if precision not in precisions:
+		raise ValueError("Valid precisions are ", precisions," but you passed ", precision)
+
+	if precision == 'float32':
+		return registry.get(model_name)
+
+	if model_name in ['Dlib', 'Ensemble']:
+		raise ValueError("Reduced precision is available for keras based single models but you passed ", model_name)
+
+	def loader():
+		model_path = get_model_path(model_name, precision)
+
+		if os.path.isfile(model_path) != True:
+			convert(registry.get(model_name), model_name, precision)
+
+		return TFLiteModel(model_path)
+
+	return registry.get(model_name+"@"+precision, loader = loader)
+
+#---------------------------------------
+
+def evaluate(dataset, model_name = 'VGG-Face', distance_metric = 'cosine', precision = 'int8', detector_backend = 'opencv'):
+
+	#dataset is a list of [img1_path, img2_path, label] items.
+	#reports how verification decisions against the tuned threshold change in reduced precision.
+
+	from deepface import DeepFace
+
+	pairs = [[instance[0], instance[1]] for instance in dataset]
+	labels = [instance[2] for instance in dataset]
+
+	base_obj = DeepFace.verify(pairs, model_name = model_name, distance_metric = distance_metric, detector_backend = detector_backend)
+	reduced_obj = DeepFace.verify(pairs, model_name = model_name, distance_metric = distance_metric, detector_backend = detector_backend, precision = precision)
+
+	base_correct = 0; reduced_correct = 0; changed_decisions = 0
+	distance_changes = []
+
+	for i in range(0, len(pairs)):
+		base_item = base_obj["pair_%s" % (i+1)]
+		reduced_item = reduced_obj["pair_%s" % (i+1)]
+
+		if base_item["verified"] == labels[i]:
+			base_correct = base_correct + 1
+
+		if reduced_item["verified"] == labels[i]:
+			reduced_correct = reduced_correct + 1
+
+		if base_item["verified"] != reduced_item["verified"]:
+			changed_decisions = changed_decisions + 1
+
+		distance_changes.append(abs(base_item["distance"] - reduced_item["distance"]))
+
+	resp_obj = {}
+	resp_obj["model"] = model_name
+	resp_obj["similarity_metric"] = distance_metric
+	resp_obj["precision"] = precision
+	resp_obj["threshold"] = base_obj["pair_1"]["max_threshold_to_verify"]
+	resp_obj["float32_accuracy"] = 100 * base_correct / len(pairs)
+	resp_obj["%s_accuracy" % (precision)] = 100 * reduced_correct / len(pairs)
+	resp_obj["changed_decisions"] = changed_decisions
+	resp_obj["mean_distance_change"] = float(np.mean(distance_changes))
+	resp_obj["max_distance_change"] = float(np.max(distance_changes))
+
+	print(resp_obj)
+
+	return resp_obj
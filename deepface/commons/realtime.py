@@ -11,7 +11,7 @@ os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 
 from ..basemodels import VGGFace, OpenFace, Facenet, FbDeepFace, DeepID
 from ..extendedmodels import Age, Gender, Race, Emotion
-from . import functions, realtime, distance as dst
+from . import functions, realtime, registry, distance as dst
 
 def analysis(db_path, model_name, distance_metric, enable_face_analysis = False):
 	
@@ -39,33 +39,32 @@ def analysis(db_path, model_name, distance_metric, enable_face_analysis = False)
 	if len(employees) > 0:
 		if model_name == 'VGG-Face':
 			print("Using VGG-Face model backend and", distance_metric,"distance.")
-			model = VGGFace.loadModel()
+			model = registry.get("VGG-Face")
 			input_shape = (224, 224)	
 		
 		elif model_name == 'OpenFace':
 			print("Using OpenFace model backend", distance_metric,"distance.")
-			model = OpenFace.loadModel()
+			model = registry.get("OpenFace")
 			input_shape = (96, 96)
 		
 		elif model_name == 'Facenet':
 			print("Using Facenet model backend", distance_metric,"distance.")
-			model = Facenet.loadModel()
+			model = registry.get("Facenet")
 			input_shape = (160, 160)
 		
 		elif model_name == 'DeepFace':
 			print("Using FB DeepFace model backend", distance_metric,"distance.")
-			model = FbDeepFace.loadModel()
+			model = registry.get("DeepFace")
 			input_shape = (152, 152)
 		
 		elif model_name == 'DeepID':
 			print("Using DeepID model backend", distance_metric,"distance.")
-			model = DeepID.loadModel()
+			model = registry.get("DeepID")
 			input_shape = (55, 47)
 		
 		elif model_name == 'Dlib':
 			print("Using Dlib model backend", distance_metric,"distance.")
-			from deepface.basemodels.DlibResNet import DlibResNet
-			model = DlibResNet()
+			model = registry.get("Dlib")
 			input_shape = (150, 150)
 		
 		else:
@@ -85,14 +84,10 @@ def analysis(db_path, model_name, distance_metric, enable_face_analysis = False)
 		
 		tic = time.time()
 		
-		emotion_model = Emotion.loadModel()
+		emotion_model = registry.get("Emotion")
 		print("Emotion model loaded")
 		
-		age_model = Age.loadModel()
-		print("Age model loaded")
-		
-		gender_model = Gender.loadModel()
-		print("Gender model loaded")
+		demography_model = registry.get_demography(['age', 'gender'])
 		
 		toc = time.time()
 		
@@ -112,8 +107,8 @@ def analysis(db_path, model_name, distance_metric, enable_face_analysis = False)
 		employee = employees[index]
 		pbar.set_description("Finding feature for %s" % (employee.split("/")[-1]))
 		feature = []
-		img = functions.preprocess_face(img = employee, target_size = (input_shape_y, input_shape_x), enforce_detection = False)
-		img_representation = model.predict(img)[0,:]
+		img = functions.preprocess_face(img = employee, target_size = (input_shape_y, input_shape_x), enforce_detection = False, rgb_uint8 = model_name == 'Dlib')
+		img_representation = functions.predict(model, img)[0,:]
 		
 		feature.append(employee)
 		feature.append(img_representation)
@@ -224,7 +219,7 @@ def analysis(db_path, model_name, distance_metric, enable_face_analysis = False)
 							
 							gray_img = functions.preprocess_face(img = custom_face, target_size = (48, 48), grayscale = True, enforce_detection = False)
 							emotion_labels = ['Angry', 'Disgust', 'Fear', 'Happy', 'Sad', 'Surprise', 'Neutral']
-							emotion_predictions = emotion_model.predict(gray_img)[0,:]
+							emotion_predictions = functions.predict(emotion_model, gray_img)[0,:]
 							sum_of_predictions = emotion_predictions.sum()
 							
 							mood_items = []
@@ -302,12 +297,14 @@ def analysis(db_path, model_name, distance_metric, enable_face_analysis = False)
 							
 							face_224 = functions.preprocess_face(img = custom_face, target_size = (224, 224), grayscale = False, enforce_detection = False)
 							
-							age_predictions = age_model.predict(face_224)[0,:]
+							age_predictions, gender_prediction = functions.predict(demography_model, face_224)
+							
+							age_predictions = age_predictions[0,:]
 							apparent_age = Age.findApparentAge(age_predictions)
 						
 							#-------------------------------
 							
-							gender_prediction = gender_model.predict(face_224)[0,:]
+							gender_prediction = gender_prediction[0,:]
 							
 							if np.argmax(gender_prediction) == 0:
 								gender = "W"
@@ -355,12 +352,12 @@ def analysis(db_path, model_name, distance_metric, enable_face_analysis = False)
 						#-------------------------------
 						#face recognition
 						
-						custom_face = functions.preprocess_face(img = custom_face, target_size = (input_shape_y, input_shape_x), enforce_detection = False)
+						custom_face = functions.preprocess_face(img = custom_face, target_size = (input_shape_y, input_shape_x), enforce_detection = False, rgb_uint8 = model_name == 'Dlib')
 						
 						#check preprocess_face function handled
 						if custom_face.shape[1:3] == input_shape:
 							if df.shape[0] > 0: #if there are images to verify, apply face recognition
-								img1_representation = model.predict(custom_face)[0,:]
+								img1_representation = functions.predict(model, custom_face)[0,:]
 								
 								#print(freezed_frame," - ",img1_representation[0:5])
 								
@@ -497,7 +494,7 @@ def generate_feature(face_image, shape_y, shape_x, model):
 	img = functions.preprocess_face(img = face_image, target_size = (shape_y, shape_x), enforce_detection = False)
 
 	# find the vector representation of the image detected above
-	img_representation = model.predict(img)[0,:]
+	img_representation = functions.predict(model, img)[0,:]
 	
 	# save the image with the vector representation
 	feature.append(face_image)
@@ -571,33 +568,32 @@ def realtime_analysis(db_path, model_name, distance_metric, enable_face_analysis
 	if len(face_images) > 0:
 		if model_name == 'VGG-Face':
 			print("Using VGG-Face model backend and", distance_metric,"distance.")
-			model = VGGFace.loadModel()
+			model = registry.get("VGG-Face")
 			input_shape = (224, 224)	
 		
 		elif model_name == 'OpenFace':
 			print("Using OpenFace model backend", distance_metric,"distance.")
-			model = OpenFace.loadModel()
+			model = registry.get("OpenFace")
 			input_shape = (96, 96)
 		
 		elif model_name == 'Facenet':
 			print("Using Facenet model backend", distance_metric,"distance.")
-			model = Facenet.loadModel()
+			model = registry.get("Facenet")
 			input_shape = (160, 160)
 		
 		elif model_name == 'DeepFace':
 			print("Using FB DeepFace model backend", distance_metric,"distance.")
-			model = FbDeepFace.loadModel()
+			model = registry.get("DeepFace")
 			input_shape = (152, 152)
 		
 		elif model_name == 'DeepID':
 			print("Using DeepID model backend", distance_metric,"distance.")
-			model = DeepID.loadModel()
+			model = registry.get("DeepID")
 			input_shape = (55, 47)
 		
 		elif model_name == 'Dlib':
 			print("Using Dlib model backend", distance_metric,"distance.")
-			from deepface.basemodels.DlibResNet import DlibResNet
-			model = DlibResNet()
+			model = registry.get("Dlib")
 			input_shape = (150, 150)
 		
 		else:
@@ -617,15 +613,9 @@ def realtime_analysis(db_path, model_name, distance_metric, enable_face_analysis
 		
 		tic = time.time()
 		
-		emotion_model = Emotion.loadModel()
+		emotion_model = registry.get("Emotion")
 		print("Emotion model loaded")
 		
-		age_model = Age.loadModel()
-		print("Age model loaded")
-		
-		gender_model = Gender.loadModel()
-		print("Gender model loaded")
-		
 		toc = time.time()
 		
 		print("Facial attribute analysis models loaded in ",toc-tic," seconds")
@@ -647,10 +637,10 @@ def realtime_analysis(db_path, model_name, distance_metric, enable_face_analysis
 		pbar.set_description("Finding feature for %s" % image_description[1])
 
 		# detect and align face
-		img = functions.preprocess_face(img = face_image, target_size = (input_shape_y, input_shape_x), enforce_detection = False)
+		img = functions.preprocess_face(img = face_image, target_size = (input_shape_y, input_shape_x), enforce_detection = False, rgb_uint8 = model_name == 'Dlib')
 
 		# find the vector representation of the image detected above
-		img_representation = model.predict(img)[0,:]
+		img_representation = functions.predict(model, img)[0,:]
 		
 		# save the image with the vector representation
 		add_to_feature_dict(person_name, img_representation, feature_dict)
@@ -711,12 +701,12 @@ def realtime_analysis(db_path, model_name, distance_metric, enable_face_analysis
 				#-------------------------------------	
 				#face recognition
 				
-				custom_face = functions.preprocess_face(detected_face, target_size = (input_shape_y, input_shape_x), enforce_detection = False)
+				custom_face = functions.preprocess_face(detected_face, target_size = (input_shape_y, input_shape_x), enforce_detection = False, rgb_uint8 = model_name == 'Dlib')
 				
 				#check preprocess_face function handled
 				if custom_face.shape[1:3] == input_shape:
 					if df.shape[0] > 0: #if there are images to verify, apply face recognition
-						img1_representation = model.predict(custom_face)[0,:]
+						img1_representation = functions.predict(model, custom_face)[0,:]
 						
 						#print(freezed_frame," - ",img1_representation[0:5])
 						
@@ -784,10 +774,10 @@ def realtime_analysis(db_path, model_name, distance_metric, enable_face_analysis
 									new_face = frame_cpy[y:y+h,x:x+w]
 									folder_name = save_new_detected_face(new_face, input("Not Recognized. Type a Name--> "))
 
-									img = functions.preprocess_face(img = new_face, target_size = (input_shape_y, input_shape_x), enforce_detection = False)
+									img = functions.preprocess_face(img = new_face, target_size = (input_shape_y, input_shape_x), enforce_detection = False, rgb_uint8 = model_name == 'Dlib')
 
 									# find the vector representation of the image detected above
-									new_face_representation = model.predict(img)[0,:]
+									new_face_representation = functions.predict(model, img)[0,:]
 									
 									# save the image with the vector representation
 									add_to_feature_dict(folder_name, new_face_representation, feature_dict)
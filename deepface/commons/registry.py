@@ -0,0 +1,375 @@
+import os
+import threading
+import time
+from pathlib import Path
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import tensorflow as tf
+from keras import backend as K
+
+from ..basemodels import VGGFace, OpenFace, Facenet, FbDeepFace, DeepID
+from ..extendedmodels import Age, Gender, Race, Emotion, Demography
+from . import functions, weights
+
+#---------------------------------------
+#process-wide registry of built models. every model is built once and shared by verify, find, analyze and stream.
+
+model_obj = OrderedDict() #model name -> built model, least recently used first
+model_sizes = {} #model name -> estimated memory usage in MB
+load_times = {} #model name -> seconds spent to build the model and load its weights
+warmup_reports = {} #model name -> cold and warm prediction latencies in seconds
+
+memory_budget = None #MB. None means no limit.
+
+#tf 1.x keeps variables and ops of every keras model in the default graph and session. dropping a model does not release them,
+#and building it again adds another copy. that's why, a memory budget cannot be set in tf 1.x. reset releases all models instead.
+releases_memory = hasattr(tf, 'get_default_graph') != True
+
+lock = threading.Lock()
+build_locks = {} #model name -> lock. concurrent requests for the same model wait for a single build.
+
+#keras layers, tf graphs and keras uid counters are not thread safe. models are built one at a time even for different names.
+#reentrant because loaders of fused and converted models get other models from the registry.
+construction_lock = threading.RLock()
+model_dependencies = {} #model name -> names of the models whose layers it uses, e.g. fused demography model
+
+#---------------------------------------
+
+def loadDlibResNet():
+	from deepface.basemodels.DlibResNet import DlibResNet #this is not a must because it is very huge.
+	return DlibResNet()
+
+def get_loaders():
+
+	loaders = {
+		'VGG-Face': VGGFace.loadModel,
+		'OpenFace': OpenFace.loadModel,
+		'Facenet': Facenet.loadModel,
+		'DeepFace': FbDeepFace.loadModel,
+		'DeepID': DeepID.loadModel,
+		'Dlib': loadDlibResNet,
+		'Emotion': Emotion.loadModel,
+		'Age': Age.loadModel,
+		'Gender': Gender.loadModel,
+		'Race': Race.loadModel
+	}
+
+	return loaders
+
+def find_model_size(model, shared_models = []):
+
+	#keras models expose their weights. float32 weights allocate 4 bytes each.
+	#weights of shared_models are not counted. they are already counted in their own entries.
+	if hasattr(model, 'count_params'):
+		shared_weights = set(id(weight) for shared_model in shared_models for weight in shared_model.weights)
+		return 4 * sum(K.count_params(weight) for weight in model.weights if id(weight) not in shared_weights) / (1024 * 1024)
+
+	if hasattr(model, 'memory_size'):
+		return model.memory_size()
+
+	return 0
+
+def enforce_memory_budget(keep = None):
+
+	#caller must hold the lock
+
+	if memory_budget is None or releases_memory != True:
+		return []
+
+	evicted = []
+
+	for model_name in list(model_obj.keys()):
+		if sum(model_sizes.values()) <= memory_budget:
+			break
+
+		if model_name == keep or model_name in find_pinned_models(keep):
+			continue
+
+		del model_obj[model_name]
+		del model_sizes[model_name]
+		evicted.append(model_name)
+
+	if len(evicted) > 0:
+		print("Models evicted to satisfy the memory budget of ", memory_budget," MB: ", evicted)
+
+	return evicted
+
+def find_pinned_models(keep = None):
+
+	#caller must hold the lock. models used by a resident model cannot be evicted because their layers are not released anyway.
+
+	return set(dependency for model_name in list(model_obj.keys()) + [keep] for dependency in model_dependencies.get(model_name, []))
+
+#---------------------------------------
+
+def get(model_name, loader = None, dependencies = []):
+
+	#dependencies are the models used by loader. their weights are not counted for this model.
+
+	#resident models are returned before the loader is validated. fused and converted models have no default loader.
+	with lock:
+		if model_name in model_obj:
+			model_obj.move_to_end(model_name)
+			return model_obj[model_name]
+
+	if loader is None:
+		loaders = get_loaders()
+
+		if model_name not in loaders:
+			raise ValueError("Invalid model_name passed - ", model_name)
+
+		def loader():
+			#serialized models are preferred if they were exported before
+			model = weights.load_artifact(model_name) if model_name != 'Dlib' else None
+
+			if model is None:
+				model = loaders[model_name]()
+
+			return model
+
+	with lock:
+		build_lock = build_locks.setdefault(model_name, threading.Lock())
+
+	#construction lock is taken first. loaders taking build locks of other models while holding it cannot deadlock.
+	with construction_lock, build_lock:
+
+		#another thread might build the same model while we are waiting
+		with lock:
+			if model_name in model_obj:
+				model_obj.move_to_end(model_name)
+				return model_obj[model_name]
+
+		tic = time.time()
+
+		model = loader()
+
+		toc = time.time()
+
+		print(model_name," model is built in ", round(toc-tic, 2)," seconds")
+
+		with lock:
+			load_times[model_name] = toc - tic
+			model_obj[model_name] = model
+			model_dependencies[model_name] = list(dependencies)
+			model_sizes[model_name] = find_model_size(model, [model_obj[dependency] for dependency in dependencies if dependency in model_obj])
+			enforce_memory_budget(keep = model_name)
+
+	return model
+
+def find_weight_file(model_name):
+
+	#returns the file the loader of the model will read or None if it is not downloaded yet
+
+	home = str(Path.home())
+
+	h5_files = {
+		'VGG-Face': 'vgg_face_weights.h5',
+		'OpenFace': 'openface_weights.h5',
+		'Facenet': 'facenet_weights.h5',
+		'DeepFace': 'VGGFace2_DeepFace_weights_val-0.9034.h5',
+		'DeepID': 'deepid_keras_weights.h5',
+		'Dlib': 'dlib_face_recognition_resnet_model_v1.dat',
+		'Emotion': 'facial_expression_model_weights.h5',
+		'Age': 'age_model_weights.h5',
+		'Gender': 'gender_model_weights.h5',
+		'Race': 'race_model_single_batch.h5'
+	}
+
+	candidates = []
+
+	if model_name != 'Dlib':
+		candidates.append(weights.get_artifact_path(model_name))
+		candidates.append(weights.get_bundle_path(model_name)+'.bin')
+
+	if model_name in h5_files:
+		candidates.append(home+'/.deepface/weights/'+h5_files[model_name])
+
+	for candidate in candidates:
+		if os.path.isfile(candidate):
+			return candidate
+
+	return None
+
+def prefetch(model_name):
+
+	#reads the weight file of the model into the page cache. used for h5 and serialized models that keras parses while building them.
+
+	weight_file = find_weight_file(model_name)
+
+	if weight_file is None:
+		return 0
+
+	size = 0
+
+	with open(weight_file, 'rb') as f:
+		for chunk in iter(lambda: f.read(16 * 1024 * 1024), b''):
+			size = size + len(chunk)
+
+	return size
+
+def get_many(model_names, parallel = True):
+
+	#graph construction is not thread safe, so missing models are built one by one in this thread.
+	#worker threads read weights of the following models meanwhile. arrays of weight bundles are read into host memory
+	#and the loader just assigns them. other weight files are read into the page cache. returns a dictionary of model name and model pairs.
+
+	missing_models = [model_name for model_name in model_names if is_resident(model_name) != True]
+
+	if parallel != True or len(missing_models) < 2:
+		return dict((model_name, get(model_name)) for model_name in model_names)
+
+	tic = time.time()
+
+	with ThreadPoolExecutor(max_workers = min(len(missing_models), functions.find_thread_count())) as executor:
+		try:
+			for model_name in missing_models:
+				weight_file = find_weight_file(model_name)
+
+				if weight_file is not None and weight_file == weights.get_bundle_path(model_name)+'.bin' and weights.use_bundles == True:
+					weights.add_pending_bundle(model_name, executor.submit(weights.read_bundle, model_name))
+				elif weight_file is not None:
+					executor.submit(prefetch, model_name)
+
+			models = dict((model_name, get(model_name)) for model_name in model_names)
+		finally:
+			weights.discard_pending_bundles(missing_models)
+
+	toc = time.time()
+
+	print(len(missing_models)," models are built in ", round(toc-tic, 2)," seconds while their weights are read concurrently")
+
+	return models
+
+def get_demography(actions):
+
+	#fused model of age, gender and race. outputs are in the order of passed actions.
+
+	model_name = "Demography-" + "-".join(actions)
+
+	def loader():
+		models = [get(action.capitalize()) for action in actions]
+		return Demography.loadModel(models, prefixes = actions)
+
+	return get(model_name, loader = loader, dependencies = [action.capitalize() for action in actions])
+
+def find_input_tensor_shape(model):
+
+	#returns (None, height, width, channels)
+
+	if hasattr(model, 'layers'): #keras based models
+		input_shape = model.layers[0].input_shape
+		if type(input_shape) == list:
+			input_shape = input_shape[0]
+	else: #dlib and tflite wrappers
+		input_shape = model.input_shape
+
+	return tuple(input_shape)
+
+def warmup(model_names = None, batch_sizes = [1], steps = 3):
+
+	#tf builds and optimizes graphs lazily. the first prediction of a fresh model is much slower than the following ones.
+	#dummy batches are fed to resident models (or the passed ones) to get them ready before the first real request.
+
+	#resident models are read from the registry as they are. fused and converted models cannot be built by their names.
+	if model_names is None:
+		with lock:
+			models = list(model_obj.items())
+	else:
+		models = [(model_name, get(model_name)) for model_name in model_names]
+
+	for model_name, model in models:
+		input_shape = find_input_tensor_shape(model)
+
+		report = {}
+		report["warm"] = {}
+
+		for batch_size in batch_sizes:
+			img = np.random.uniform(0, 1, size = (batch_size,) + tuple(input_shape[1:])).astype(np.float32)
+
+			tic = time.time()
+			functions.predict(model, img)
+			toc = time.time()
+
+			if "cold" not in report:
+				report["cold"] = toc - tic
+
+			latencies = []
+			for i in range(0, steps):
+				tic = time.time()
+				functions.predict(model, img)
+				toc = time.time()
+				latencies.append(toc - tic)
+
+			report["warm"][batch_size] = float(np.median(latencies))
+
+		with lock:
+			warmup_reports[model_name] = report
+
+		print(model_name," cold prediction lasts ", round(report["cold"], 4)," seconds. warm predictions: ", report["warm"])
+
+	return dict((model_name, warmup_reports[model_name]) for model_name, model in models)
+
+def evict(model_name = None):
+
+	#evict the passed model or all models if nothing is passed. returns the names of evicted models.
+	#models using the evicted one, e.g. fused demography model of age, are evicted as well.
+
+	with lock:
+		if model_name is None:
+			evicted = list(model_obj.keys())
+		elif model_name in model_obj:
+			evicted = [model_name] + [name for name in model_obj.keys() if model_name in model_dependencies.get(name, [])]
+		else:
+			evicted = []
+
+		for name in evicted:
+			del model_obj[name]
+			del model_sizes[name]
+
+	if len(evicted) > 0 and releases_memory != True:
+		print("WARNING: evicted models stay in the tf graph until registry.reset() is called. Building them again allocates another copy.")
+
+	return evicted
+
+def reset():
+
+	#evicts all models and releases their memory. tf 1.x keeps them in the default graph, so a fresh graph and session are created.
+	#models built outside the registry and mtcnn detectors live in the same graph. they cannot be used anymore and mtcnn is built again on demand.
+
+	evicted = evict()
+
+	if releases_memory != True:
+		K.clear_session()
+
+		with functions.detector_lock:
+			functions.detector_obj.pop('mtcnn', None)
+
+	return evicted
+
+def set_memory_budget(budget):
+
+	#budget is in MB. pass None to disable the limit.
+
+	global memory_budget
+
+	if budget is not None and releases_memory != True:
+		raise ValueError("Memory budget of the model registry requires tf 2.x. Evicted models are not released in tf 1.x. Call registry.reset() to release all models instead. You passed ", budget)
+
+	with lock:
+		memory_budget = budget
+		evicted = enforce_memory_budget()
+
+	return evicted
+
+def is_resident(model_name):
+	with lock:
+		return model_name in model_obj
+
+def resident():
+
+	#returns resident models and their estimated memory usage in MB, least recently used first
+
+	with lock:
+		return OrderedDict((model_name, model_sizes[model_name]) for model_name in model_obj.keys())
@@ -0,0 +1,287 @@
+import os
+import json
+import mmap
+import time
+import hashlib
+import threading
+from pathlib import Path
+import numpy as np
+
+#---------------------------------------
+#flat weight bundles. weights of a model are stored back to back in a single binary file and every array starts on a page boundary.
+#bundles are memory mapped in read only mode. a bundle is read from the page cache instead of parsing an h5 file.
+#set_weights still copies the arrays into backend variables. each worker keeps its own copy of the weights.
+
+use_bundles = True #benchmark disables bundles to time the h5 path
+
+pending_bundles = {} #model name -> future of arrays read by registry.get_many while other models are being built
+pending_lock = threading.Lock()
+
+def get_bundle_path(model_name):
+	home = str(Path.home())
+	file_name = model_name.replace("-", "_").lower()
+	return home+'/.deepface/weights/'+file_name+'_bundle'
+
+def align(offset):
+	return ((offset + mmap.PAGESIZE - 1) // mmap.PAGESIZE) * mmap.PAGESIZE
+
+def save_bundle(model, model_name):
+
+	bundle_path = get_bundle_path(model_name)
+
+	index = []
+	offset = 0
+
+	#write into temporary files first. workers should never map a partially written bundle.
+	with open(bundle_path+'.bin.tmp', 'wb') as f:
+		for weight in model.get_weights():
+			weight = np.ascontiguousarray(weight)
+
+			offset = align(offset)
+			f.seek(offset)
+			f.write(weight.tobytes())
+
+			index.append({"shape": list(weight.shape), "dtype": weight.dtype.str, "offset": offset})
+			offset = offset + weight.nbytes
+
+		#file must cover the aligned offset of every array including empty ones
+		f.truncate(align(offset))
+
+	with open(bundle_path+'.json.tmp', 'w') as f:
+		json.dump(index, f)
+
+	os.replace(bundle_path+'.bin.tmp', bundle_path+'.bin')
+	os.replace(bundle_path+'.json.tmp', bundle_path+'.json')
+
+	print(model_name," weights are stored in ", bundle_path+'.bin')
+
+	return bundle_path+'.bin'
+
+def map_bundle(model_name):
+
+	#returns read only arrays backed by the memory mapped bundle or None if the bundle does not exist
+
+	bundle_path = get_bundle_path(model_name)
+
+	if os.path.isfile(bundle_path+'.bin') != True or os.path.isfile(bundle_path+'.json') != True:
+		return None
+
+	with open(bundle_path+'.json', 'r') as f:
+		index = json.load(f)
+
+	if len(index) == 0:
+		return []
+
+	buffer = np.memmap(bundle_path+'.bin', dtype = np.uint8, mode = 'r')
+
+	weights = []
+	for item in index:
+		weight = np.ndarray(shape = tuple(item["shape"]), dtype = np.dtype(item["dtype"]), buffer = buffer, offset = item["offset"])
+		weights.append(weight)
+
+	return weights
+
+def read_bundle(model_name):
+
+	#copies arrays of the bundle into host memory. disk reads and the copy do not touch keras, so they can run in another thread.
+
+	weights = map_bundle(model_name)
+
+	if weights is None:
+		return None
+
+	return [np.array(weight) for weight in weights]
+
+def add_pending_bundle(model_name, future):
+	with pending_lock:
+		pending_bundles[model_name] = future
+
+def discard_pending_bundles(model_names):
+
+	#reads of models built from other sources, e.g. serialized models, are not needed anymore
+
+	with pending_lock:
+		for model_name in model_names:
+			pending_bundles.pop(model_name, None)
+
+def load_bundle(model, model_name):
+
+	#assigns weights from the bundle. returns False if there is no valid bundle for the model.
+
+	from keras import backend as K
+
+	with pending_lock:
+		future = pending_bundles.pop(model_name, None)
+
+	if use_bundles != True:
+		weights = None
+	elif future is not None:
+		weights = future.result() #arrays are already read if the worker is ahead of the builder
+	else:
+		weights = map_bundle(model_name)
+
+	if weights is None:
+		return False
+
+	#shapes are read from variables. get_weights would copy every randomly initialized weight into host memory.
+	model_shapes = [K.int_shape(weight) for weight in model.weights]
+
+	if len(weights) != len(model_shapes) or any(weights[i].shape != tuple(model_shapes[i]) for i in range(0, len(weights))):
+		print("WARNING: ", get_bundle_path(model_name),".bin does not match the structure of ", model_name," model. Convert it again.")
+		return False
+
+	model.set_weights(weights)
+
+	return True
+
+def convert(model_names = ['VGG-Face', 'OpenFace', 'Facenet', 'DeepFace', 'DeepID', 'Emotion', 'Age', 'Gender', 'Race']):
+
+	#dlib is not a keras model and it reads its own weight file. that's why, it is not in the list.
+
+	from . import registry
+
+	bundles = {}
+
+	for model_name in model_names:
+		model = registry.get(model_name)
+		bundles[model_name] = save_bundle(model, model_name)
+
+	return bundles
+
+#---------------------------------------
+#serialized models. graph structure and weights of a built model are stored together in a single h5 file.
+#loading it skips the layer by layer construction code of the model modules and weight download checks.
+#a serialized model is ignored if model code, keras version or the weight bundle changed after it was exported.
+
+def get_artifact_path(model_name):
+	home = str(Path.home())
+	file_name = model_name.replace("-", "_").lower()
+	return home+'/.deepface/weights/'+file_name+'_model.h5'
+
+def find_artifact_signature(model_name):
+
+	#model modules define the structure of serialized models. a change in any of them makes artifacts stale.
+
+	import keras
+
+	package_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+	hasher = hashlib.sha1()
+
+	for folder in ['basemodels', 'extendedmodels']:
+		for file_name in sorted(os.listdir(os.path.join(package_path, folder))):
+			if file_name.endswith('.py'):
+				with open(os.path.join(package_path, folder, file_name), 'rb') as f:
+					hasher.update(f.read())
+
+	bundle_path = get_bundle_path(model_name)+'.bin'
+
+	signature = {}
+	signature["keras"] = keras.__version__
+	signature["source"] = hasher.hexdigest()
+	signature["bundle"] = os.path.getmtime(bundle_path) if os.path.isfile(bundle_path) else None
+
+	return signature
+
+def get_custom_objects():
+
+	#lambda layers refer these objects in their functions
+
+	import tensorflow as tf
+	from keras import backend as K
+	from deepface.basemodels import Facenet
+
+	return {'tf': tf, 'K': K, 'scaling': Facenet.scaling}
+
+def export_model(model, model_name):
+
+	artifact_path = get_artifact_path(model_name)
+
+	model.save(artifact_path+'.tmp', include_optimizer = False)
+
+	with open(artifact_path+'.json.tmp', 'w') as f:
+		json.dump(find_artifact_signature(model_name), f)
+
+	os.replace(artifact_path+'.tmp', artifact_path)
+	os.replace(artifact_path+'.json.tmp', artifact_path+'.json')
+
+	print(model_name," model is serialized into ", artifact_path)
+
+	return artifact_path
+
+def load_artifact(model_name):
+
+	#returns None if the model is not exported yet or it is stale
+
+	artifact_path = get_artifact_path(model_name)
+
+	if os.path.isfile(artifact_path) != True:
+		return None
+
+	signature = None
+	if os.path.isfile(artifact_path+'.json'):
+		with open(artifact_path+'.json', 'r') as f:
+			signature = json.load(f)
+
+	if signature != find_artifact_signature(model_name):
+		print("WARNING: ", artifact_path," is stale. It is exported with another model code, keras version or weight bundle. Export it again.")
+		return None
+
+	from keras.models import load_model
+
+	return load_model(artifact_path, custom_objects = get_custom_objects(), compile = False)
+
+def export(model_names = ['VGG-Face', 'OpenFace', 'Facenet', 'DeepFace', 'DeepID', 'Emotion', 'Age', 'Gender', 'Race']):
+
+	from . import registry
+
+	artifacts = {}
+
+	for model_name in model_names:
+		model = registry.get(model_name)
+		artifacts[model_name] = export_model(model, model_name)
+
+	return artifacts
+
+def benchmark(model_names = ['VGG-Face', 'OpenFace', 'Facenet', 'DeepFace', 'DeepID', 'Emotion', 'Age', 'Gender', 'Race']):
+
+	#compares building models in python with h5 weights, building them with weight bundles and loading serialized models
+
+	global use_bundles
+
+	from . import registry
+
+	loaders = registry.get_loaders()
+
+	results = {}
+
+	for model_name in model_names:
+		use_bundles = False
+		try:
+			tic = time.time()
+			model = loaders[model_name]()
+			toc = time.time()
+		finally:
+			use_bundles = True
+
+		results[model_name] = {"h5": toc - tic}
+
+		if os.path.isfile(get_bundle_path(model_name)+'.bin'):
+			tic = time.time()
+			loaders[model_name]()
+			toc = time.time()
+
+			results[model_name]["bundle"] = toc - tic
+
+		if load_artifact(model_name) is None:
+			export_model(model, model_name)
+
+		tic = time.time()
+		load_artifact(model_name)
+		toc = time.time()
+
+		results[model_name]["artifact"] = toc - tic
+
+		print(model_name,": ", dict((key, round(value, 2)) for key, value in results[model_name].items())," seconds")
+
+	return results
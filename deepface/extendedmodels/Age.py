@@ -9,15 +9,18 @@ import numpy as np
 from keras.models import Model, Sequential
 from keras.layers import Convolution2D, Flatten, Activation
 
+from deepface.commons import weights
+
 def loadModel():
 	
-	model = VGGFace.baseModel()
+	#vgg-face classifier is not needed. attribute heads are built on its fully connected layers.
+	model = VGGFace.featureModel()
 	
 	#--------------------------
 	
 	classes = 101
 	base_model_output = Sequential()
-	base_model_output = Convolution2D(classes, (1, 1), name='predictions')(model.layers[-4].output)
+	base_model_output = Convolution2D(classes, (1, 1), name='age_predictions')(model.layers[-1].output)
 	base_model_output = Flatten()(base_model_output)
 	base_model_output = Activation('softmax')(base_model_output)
 	
@@ -25,6 +28,9 @@ def loadModel():
 
 	age_model = Model(inputs=model.input, outputs=base_model_output)
 	
+	if weights.load_bundle(age_model, 'Age') == True:
+		return age_model
+	
 	#--------------------------
 	
 	#load weights
@@ -0,0 +1,89 @@
+import numpy as np
+from keras.models import Model
+from keras.layers import Input, InputLayer
+
+#age, gender and race models are all built on VGG-Face with 224x224x3 inputs.
+#this module fuses them into a single multi-output model to find all predictions in one forward pass.
+
+def has_same_weights(layers):
+
+	base_weights = layers[0].get_weights()
+
+	for layer in layers[1:]:
+		weights = layer.get_weights()
+
+		if len(weights) != len(base_weights):
+			return False
+
+		for i in range(0, len(weights)):
+			if weights[i].shape != base_weights[i].shape or np.array_equal(weights[i], base_weights[i]) != True:
+				return False
+
+	return True
+
+def rename_layer(layer, name):
+
+	if hasattr(layer, '_name'): #keras 2.3 and later
+		layer._name = name
+	else:
+		layer.name = name
+
+def loadModel(models, prefixes = None):
+
+	#models is a list of already built models such as [age_model, gender_model, race_model].
+	#returned model has one output for each of them in the same order.
+	#prefixes such as ['age', 'gender', 'race'] are used to rename the layers having the same name in separate heads.
+
+	if prefixes is None:
+		prefixes = ['model_' + str(i) for i in range(0, len(models))]
+
+	model_layers = []
+	for model in models:
+		layers = [layer for layer in model.layers if isinstance(layer, InputLayer) != True]
+		model_layers.append(layers)
+
+	num_of_layers = len(model_layers[0])
+
+	for layers in model_layers[1:]:
+		if len(layers) != num_of_layers:
+			raise ValueError("Models to be fused must have the same structure but they have ", [len(layers) for layers in model_layers]," layers")
+
+	#--------------------------
+
+	inputs = Input(shape=(224, 224, 3))
+
+	outputs = [inputs for model in models]
+
+	shared = True
+	num_of_shared_layers = 0
+
+	for i in range(0, num_of_layers):
+		layers = [model_layer[i] for model_layer in model_layers]
+
+		#layers will be shared until the first layer having different weights. heads are built separately after that point.
+		if shared == True and has_same_weights(layers) == True:
+			output = layers[0](outputs[0])
+			outputs = [output for model in models]
+			num_of_shared_layers = num_of_shared_layers + 1
+		else:
+			shared = False
+			for j in range(0, len(models)):
+				outputs[j] = layers[j](outputs[j])
+
+	print(num_of_shared_layers," of ", num_of_layers," layers are shared in the fused model")
+
+	#--------------------------
+	#a keras model cannot have two layers with the same name. heads of serialized models might keep the same layer names.
+
+	head_layers = [(j, model_layers[j][i]) for i in range(num_of_shared_layers, num_of_layers) for j in range(0, len(models))]
+	head_names = [layer.name for j, layer in head_layers]
+
+	for j, layer in head_layers:
+		if head_names.count(layer.name) > 1:
+			rename_layer(layer, prefixes[j] + '_' + layer.name)
+
+	#--------------------------
+
+	fused_model = Model(inputs=inputs, outputs=outputs)
+
+	return fused_model
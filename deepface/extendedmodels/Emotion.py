@@ -5,6 +5,8 @@ from keras.models import Model, Sequential
 from keras.layers import Conv2D, MaxPooling2D, AveragePooling2D, Flatten, Dense, Dropout
 import zipfile
 
+from deepface.commons import weights
+
 def loadModel():
 	
 	num_classes = 7
@@ -35,6 +37,9 @@ def loadModel():
 
 	model.add(Dense(num_classes, activation='softmax'))
 	
+	if weights.load_bundle(model, 'Emotion') == True:
+		return model
+	
 	#----------------------------
 	
 	home = str(Path.home())
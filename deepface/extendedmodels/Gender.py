@@ -8,15 +8,17 @@ import numpy as np
 from keras.models import Model, Sequential
 from keras.layers import Convolution2D, Flatten, Activation
 
+from deepface.commons import weights
+
 def loadModel():
 	
-	model = VGGFace.baseModel()
+	model = VGGFace.featureModel()
 	
 	#--------------------------
 	
 	classes = 2
 	base_model_output = Sequential()
-	base_model_output = Convolution2D(classes, (1, 1), name='predictions')(model.layers[-4].output)
+	base_model_output = Convolution2D(classes, (1, 1), name='gender_predictions')(model.layers[-1].output)
 	base_model_output = Flatten()(base_model_output)
 	base_model_output = Activation('softmax')(base_model_output)
 	
@@ -24,6 +26,9 @@ def loadModel():
 
 	gender_model = Model(inputs=model.input, outputs=base_model_output)
 	
+	if weights.load_bundle(gender_model, 'Gender') == True:
+		return gender_model
+	
 	#--------------------------
 	
 	#load weights
@@ -9,15 +9,17 @@ from keras.models import Model, Sequential
 from keras.layers import Convolution2D, Flatten, Activation
 import zipfile
 
+from deepface.commons import weights
+
 def loadModel():
 	
-	model = VGGFace.baseModel()
+	model = VGGFace.featureModel()
 	
 	#--------------------------
 	
 	classes = 6
 	base_model_output = Sequential()
-	base_model_output = Convolution2D(classes, (1, 1), name='predictions')(model.layers[-4].output)
+	base_model_output = Convolution2D(classes, (1, 1), name='race_predictions')(model.layers[-1].output)
 	base_model_output = Flatten()(base_model_output)
 	base_model_output = Activation('softmax')(base_model_output)
 	
@@ -25,6 +27,9 @@ def loadModel():
 
 	race_model = Model(inputs=model.input, outputs=base_model_output)
 	
+	if weights.load_bundle(race_model, 'Race') == True:
+		return race_model
+	
 	#--------------------------
 	
 	#load weights
@@ -2,6 +2,7 @@ from deepface import DeepFace
 from deepface.commons import functions
 import json
 import time
+import numpy as np
 
 import os
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
@@ -154,6 +155,135 @@ print(resp_obj)
 #-----------------------------------
 print("--------------------------")
 
+print("Model registry")
+
+from deepface.commons import registry
+
+tic = time.time()
+resp_obj = DeepFace.verify("dataset/img1.jpg", "dataset/img2.jpg", model_name = "VGG-Face")
+toc = time.time()
+
+print("VGG-Face is resident: ", registry.is_resident("VGG-Face"), ", verify lasts ", toc-tic, " seconds")
+print(registry.resident())
+
+assert DeepFace.build_model("VGG-Face") is registry.get("VGG-Face")
+
+report = registry.warmup(["VGG-Face"], batch_sizes = [1, 4])
+print("VGG-Face cold prediction: ", report["VGG-Face"]["cold"], " seconds, warm predictions: ", report["VGG-Face"]["warm"])
+
+registry.evict("VGG-Face")
+assert registry.is_resident("VGG-Face") == False
+
+#-----------------------------------
+print("--------------------------")
+
+print("Fused demography model")
+
+demography_model = registry.get_demography(['age', 'gender', 'race'])
+
+img = functions.preprocess_face("dataset/img1.jpg", target_size = (224, 224))
+fused_predictions = functions.predict(demography_model, img)
+
+for action, prediction in zip(['age', 'gender', 'race'], fused_predictions):
+	assert abs(prediction - functions.predict(registry.get(action.capitalize()), img)).max() < 1e-5
+
+#layers of the fused model belong to age, gender and race models
+assert registry.resident()["Demography-age-gender-race"] < 1
+
+registry.evict("Age")
+assert registry.is_resident("Demography-age-gender-race") == False
+
+#-----------------------------------
+print("--------------------------")
+
+print("Warmup of resident models")
+
+#analyze builds the fused demography model. it has no default loader but it is warmed up as a resident model.
+resp_obj = DeepFace.analyze("dataset/img1.jpg", actions = ['age', 'gender', 'race'])
+
+report = registry.warmup()
+assert "Demography-age-gender-race" in report.keys()
+
+#-----------------------------------
+print("--------------------------")
+
+print("Memory mapped weight bundles")
+
+from deepface.commons import weights
+
+img = functions.preprocess_face("dataset/img1.jpg", target_size = (224, 224))
+h5_representation = vggface_model.predict(img)[0,:]
+
+weights.convert(['VGG-Face'])
+registry.evict("VGG-Face")
+
+bundle_representation = registry.get("VGG-Face").predict(img)[0,:]
+assert abs(h5_representation - bundle_representation).max() < 1e-5
+
+weights.benchmark(['VGG-Face'])
+registry.evict("VGG-Face")
+
+artifact_representation = registry.get("VGG-Face").predict(img)[0,:]
+assert abs(h5_representation - artifact_representation).max() < 1e-5
+
+#-----------------------------------
+print("--------------------------")
+
+print("Reduced precision models")
+
+from deepface.commons import quantization
+
+for precision in ['float16', 'int8']:
+	resp_obj = quantization.evaluate(dataset, model_name = 'VGG-Face', distance_metric = 'cosine', precision = precision)
+	print(precision, " changes ", resp_obj["changed_decisions"], " of ", len(dataset), " decisions")
+
+#-----------------------------------
+print("--------------------------")
+
+print("Batch normalization folding")
+
+for model_name, model_module in [("Facenet", Facenet), ("OpenFace", OpenFace)]:
+	model = model_module.loadModel()
+	folded_model = model_module.loadModel(fold_batchnorm = True)
+	
+	input_shape = functions.find_input_shape(model)
+	img = functions.preprocess_face("dataset/img1.jpg", target_size = (input_shape[1], input_shape[0]))
+	
+	tic = time.time(); representation = model.predict(img)[0,:]; toc = time.time()
+	folded_tic = time.time(); folded_representation = folded_model.predict(img)[0,:]; folded_toc = time.time()
+	
+	print(model_name, ": ", toc-tic, " seconds before folding, ", folded_toc-folded_tic, " seconds after folding")
+	assert abs(representation - folded_representation).max() < 1e-3 * abs(representation).max()
+
+#-----------------------------------
+print("--------------------------")
+
+print("OpenCV DNN engine")
+
+from deepface.commons import distance as dst
+
+for model_name in ['VGG-Face', 'Facenet', 'OpenFace', 'DeepFace']:
+	model = DeepFace.build_model(model_name)
+	opencv_model = DeepFace.build_model(model_name, engine = 'opencv')
+	
+	input_shape = functions.find_input_shape(model)
+	img = functions.preprocess_face("dataset/img1.jpg", target_size = (input_shape[1], input_shape[0]))
+	
+	representation = functions.predict(model, img)[0,:]
+	opencv_representation = functions.predict(opencv_model, img)[0,:]
+	
+	print(model_name, ": cosine distance between keras and opencv embeddings is ", dst.findCosineDistance(representation, opencv_representation))
+	assert dst.findCosineDistance(representation, opencv_representation) < 1e-4
+
+resp_obj = DeepFace.verify("dataset/img1.jpg", "dataset/img2.jpg", engine = 'opencv')
+assert resp_obj["verified"] == DeepFace.verify("dataset/img1.jpg", "dataset/img2.jpg")["verified"]
+
+resp_obj = DeepFace.analyze("dataset/img4.jpg", engine = 'opencv')
+print(resp_obj)
+
+#-----------------------------------
+print("--------------------------")
+
 print("Analyze function with passing pre-trained model")
 
 from deepface.extendedmodels import Age, Gender, Race, Emotion
@@ -175,6 +305,24 @@ print(resp_obj)
 #-----------------------------------
 print("--------------------------")
 
+print("Fused age, gender and race model")
+
+demography_model = registry.get_demography(['age', 'gender', 'race'])
+
+img = functions.preprocess_face("dataset/img1.jpg", target_size = (224, 224))
+age_predictions, gender_predictions, race_predictions = demography_model.predict(img)
+
+assert abs(age_predictions - age_model.predict(img)).max() < 1e-5
+assert abs(gender_predictions - gender_model.predict(img)).max() < 1e-5
+assert abs(race_predictions - race_model.predict(img)).max() < 1e-5
+
+fused_obj = DeepFace.analyze("dataset/img1.jpg", actions = ['age', 'gender', 'race'])
+print(fused_obj)
+assert fused_obj["gender"] == resp_obj["gender"] and fused_obj["dominant_race"] == resp_obj["dominant_race"]
+
+#-----------------------------------
+print("--------------------------")
+
 print("Ensemble for find function")
 df = DeepFace.find(img_path = "dataset/img1.jpg", db_path = "dataset", model_name = "Ensemble")
 print(df.head())
@@ -230,5 +378,149 @@ for backend in backends:
 	
 	print("Backend ", backend, " is done in ", toc-tic," seconds")
 
+#-----------------------------------
+print("--------------------------")
+
+print("Multiple faces in an image")
+
+for backend in backends:
+	faces = DeepFace.detect_faces("dataset/img11.jpg", detector_backend = backend)
+	print(backend, " found ", len(faces), " faces")
+	assert len(faces) > 0
+
+embeddings = DeepFace.represent("dataset/img11.jpg", model_name = "VGG-Face", all_faces = True)
+assert len(embeddings) == len(DeepFace.detect_faces("dataset/img11.jpg"))
+
+single_embedding = DeepFace.represent("dataset/img11.jpg", model_name = "VGG-Face")
+assert abs(np.array(single_embedding) - np.array(embeddings[0]["embedding"])).max() < 1e-4
+
+dfs = DeepFace.find("dataset/img11.jpg", db_path = "dataset", all_faces = True)
+assert len(dfs) == len(embeddings)
+
+face_objs = DeepFace.analyze("dataset/img11.jpg", all_faces = True)
+print(face_objs)
+
+#-----------------------------------
+print("--------------------------")
+
+print("Batch detection")
+
+img_paths = ["dataset/img1.jpg", "dataset/img2.jpg", "dataset/img11.jpg"]
+
+imgs = functions.preprocess_face_batch(img_paths, detector_backend = 'ssd')
+
+for i in range(0, len(img_paths)):
+	img = functions.preprocess_face(img_paths[i], detector_backend = 'ssd')
+	assert abs(imgs[i] - img[0]).max() < 1e-5
+
+imgs = [functions.load_image(img_path) for img_path in img_paths]
+
+batch_faces = functions.find_faces_batch(imgs, detector_backend = 'mtcnn')
+
+for i in range(0, len(imgs)):
+	faces = functions.find_faces(imgs[i], detector_backend = 'mtcnn')
+	assert [face["box"] for face in faces] == [face["box"] for face in batch_faces[i]]
+
+#-----------------------------------
+print("--------------------------")
+
+print("Affine alignment")
+
+for backend in backends:
+	rotated_img = functions.preprocess_face("dataset/img1.jpg", detector_backend = backend)
+	
+	functions.set_alignment_mode("affine")
+	warped_img = functions.preprocess_face("dataset/img1.jpg", detector_backend = backend)
+	functions.set_alignment_mode("rotate")
+	
+	assert rotated_img.shape == warped_img.shape
+	print(backend, " mean absolute difference of rotated and warped faces: ", abs(rotated_img - warped_img).mean())
+
+functions.set_alignment_mode("affine")
+obj = DeepFace.verify("dataset/img1.jpg", "dataset/img2.jpg", model_name = "VGG-Face")
+functions.set_alignment_mode("rotate")
+assert obj["verified"] == True
+
+#-----------------------------------
+print("--------------------------")
+
+print("Detection on downscaled images")
+
+img = functions.load_image("dataset/img1.jpg")
+
+for backend in ['opencv', 'dlib', 'mtcnn']:
+	faces = functions.find_faces(img, detector_backend = backend)
+	
+	functions.set_max_detection_side(max(img.shape[0:2]) // 2)
+	downscaled_faces = functions.find_faces(img, detector_backend = backend)
+	functions.set_max_detection_side(None)
+	
+	print(backend, " boxes: ", faces[0]["box"], " and ", downscaled_faces[0]["box"])
+	assert abs(np.array(faces[0]["box"]) - np.array(downscaled_faces[0]["box"])).max() < 0.1 * faces[0]["box"][2]
+
+#-----------------------------------
+print("--------------------------")
+
+print("Reduced resolution decoding")
+
+img = functions.load_image("dataset/img1.jpg")
+
+functions.set_min_decode_side(max(img.shape[0:2]) // 4)
+reduced_img = functions.load_image("dataset/img1.jpg")
+reduced_face = functions.preprocess_face("dataset/img1.jpg")
+functions.set_min_decode_side(None)
+
+print("full resolution: ", img.shape, ", reduced: ", reduced_img.shape)
+assert max(reduced_img.shape[0:2]) >= max(img.shape[0:2]) // 4
+assert max(reduced_img.shape[0:2]) < max(img.shape[0:2])
+assert reduced_face.shape == (1, 224, 224, 3)
+
+#-----------------------------------
+print("--------------------------")
+
+print("Face cache")
+
+from deepface.commons import face_cache
+
+face_cache.configure(budget = 64)
+face_cache.clear()
+
+img = functions.preprocess_face("dataset/img1.jpg", target_size = (224, 224))
+gray_img = functions.preprocess_face("dataset/img1.jpg", target_size = (48, 48), grayscale = True)
+
+assert face_cache.stats()["hits"] == 1 and face_cache.stats()["misses"] == 1
+
+face_cache.configure(budget = 0)
+uncached_img = functions.preprocess_face("dataset/img1.jpg", target_size = (224, 224))
+uncached_gray_img = functions.preprocess_face("dataset/img1.jpg", target_size = (48, 48), grayscale = True)
+face_cache.configure(budget = 64)
+
+assert abs(img - uncached_img).max() < 1e-5
+assert abs(gray_img - uncached_gray_img).max() < 1e-5
+
+imgs = functions.preprocess_face_batch(["dataset/img1.jpg", "dataset/img2.jpg"])
+assert abs(imgs[0] - img[0]).max() < 1e-5
+
+print(face_cache.stats())
+
+face_cache.configure(budget = 0)
+face_cache.clear()
+
+#-----------------------------------
+print("--------------------------")
+
+print("Regions of reduced resolution decoding")
+
+img = functions.load_image("dataset/img1.jpg")
+faces = DeepFace.detect_faces("dataset/img1.jpg")
+
+functions.set_min_decode_side(max(img.shape[0:2]) // 4)
+reduced_faces = DeepFace.detect_faces("dataset/img1.jpg")
+functions.set_min_decode_side(None)
+
+#boxes are mapped back to the original image
+print("boxes: ", faces[0]["box"], " and ", reduced_faces[0]["box"])
+assert abs(np.array(faces[0]["box"]) - np.array(reduced_faces[0]["box"])).max() < 0.1 * faces[0]["box"][2]
+
 #-----------------------------------
 print("--------------------------")
\ No newline at end of file